@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# Times the stages of multi-repository-dependency.py on generated workspaces.
+#     ./benchmark_dependency_order.py --sizes 10,100,1000 --output bench.json
+#     ./benchmark_dependency_order.py --sizes 10,100,1000 --compare bench.json
+
+import os
+import sys
+import imp
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+from dependency_model import deep_size, to_json
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GROUP_ID = 'com.dell.cpsd'
+DEPENDENCY_TREE_OUTPUT = 'dependency_tree'
+THIRD_PARTY_ARTIFACTS = ['org.springframework:spring-core', 'org.springframework:spring-context', 'com.fasterxml.jackson.core:jackson-databind',
+                         'org.slf4j:slf4j-api', 'ch.qos.logback:logback-classic', 'com.google.guava:guava', 'org.apache.commons:commons-lang3',
+                         'io.netty:netty-all', 'org.yaml:snakeyaml', 'com.rabbitmq:amqp-client', 'junit:junit', 'org.mockito:mockito-core']
+
+
+def load_dependency_script():
+    # The script name has a dash in it so it can not be imported the normal way.
+    return imp.load_source('multi_repository_dependency', os.path.join(SCRIPT_DIRECTORY, 'multi-repository-dependency.py'))
+
+
+def repository_name(index):
+    return 'repo-{:05d}'.format(index)
+
+
+def write_pom(repository, modules):
+    with open(os.path.join(repository, 'pom.xml'), 'w') as pom:
+        pom.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        pom.write('<project xmlns="http://maven.apache.org/POM/4.0.0">\n')
+        pom.write('    <modelVersion>4.0.0</modelVersion>\n')
+        pom.write('    <groupId>{}</groupId>\n'.format(GROUP_ID))
+        pom.write('    <artifactId>{}-parent</artifactId>\n'.format(repository))
+        pom.write('    <version>1.0.0</version>\n')
+        pom.write('    <packaging>pom</packaging>\n')
+        pom.write('    <modules>\n')
+        for module in modules:
+            pom.write('        <module>{}</module>\n'.format(module))
+        pom.write('    </modules>\n')
+        pom.write('</project>\n')
+
+
+def write_dependency_tree(repository, index, modules, upstream_modules, rng):
+    with open('{}.{}'.format(repository, DEPENDENCY_TREE_OUTPUT), 'w') as f:
+        f.write('{:040x}\n'.format(rng.getrandbits(160)))
+        f.write('https://github.com/dellemc-symphony/{}.git\n'.format(repository))
+        for module_number, module in enumerate(modules):
+            f.write('{}:{}:jar:1.0.{}\n'.format(GROUP_ID, module, index))
+            children = []
+            # Later modules of a repository depend on the first one, like an api module.
+            if module_number > 0:
+                children.append(('{}:{}:jar:1.0.{}:compile'.format(GROUP_ID, modules[0], index), []))
+            for upstream_module, upstream_index in upstream_modules:
+                transitive = [('{}:jar:{}.0:compile'.format(artifact, rng.randint(1, 5)), []) for artifact in rng.sample(THIRD_PARTY_ARTIFACTS, 2)]
+                children.append(('{}:{}:jar:1.0.{}:compile'.format(GROUP_ID, upstream_module, upstream_index), transitive))
+            for artifact in rng.sample(THIRD_PARTY_ARTIFACTS, rng.randint(3, 8)):
+                transitive = [('{}:jar:{}.1:compile'.format(other, rng.randint(1, 5)), []) for other in rng.sample(THIRD_PARTY_ARTIFACTS, rng.randint(0, 3))]
+                children.append(('{}:jar:{}.0:compile'.format(artifact, rng.randint(1, 5)), transitive))
+            write_tree_children(f, children, '')
+
+
+def write_tree_children(f, children, indent):
+    for position, (coordinates, grandchildren) in enumerate(children):
+        last = position == len(children) - 1
+        f.write('{}{} {}\n'.format(indent, '\\-' if last else '+-', coordinates))
+        write_tree_children(f, grandchildren, indent + ('   ' if last else '|  '))
+
+
+def generate_workspace(path, repository_count, seed):
+    rng = random.Random(seed)
+    produced_modules = []
+    for index in range(repository_count):
+        repository = repository_name(index)
+        os.mkdir(os.path.join(path, repository))
+        modules = ['{}-{}'.format(repository, suffix) for suffix in ('api', 'service', 'client')[:rng.randint(1, 3)]]
+        write_pom(os.path.join(path, repository), modules)
+        upstream_modules = []
+        if produced_modules:
+            # Squaring a uniform number favours the early repositories which gives a skewed fan-in.
+            for _ in range(min(len(produced_modules), rng.randint(0, 6))):
+                upstream_modules.append(produced_modules[int(len(produced_modules) * rng.random() ** 2)])
+        current_directory = os.getcwd()
+        os.chdir(path)
+        try:
+            write_dependency_tree(repository, index, modules, sorted(set(upstream_modules)), rng)
+        finally:
+            os.chdir(current_directory)
+        produced_modules.extend((module, index) for module in modules)
+
+
+def time_stage(results, stage, function, *args):
+    # Stage output is thrown away so printing does not dominate the timings.
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        start = time.time()
+        value = function(*args)
+        results[stage] = min(results.get(stage, float('inf')), time.time() - start)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+    return value
+
+
+def write_json_report(repository_dependency_info):
+    with open('symphony_dependency_order_data.json', 'w') as f:
+        json.dump(repository_dependency_info, f, sort_keys=True, indent=2, ensure_ascii=False, default=to_json)
+
+
+def benchmark_workspace(script, path, repeat):
+    stages = {}
+    memory = {}
+    current_directory = os.getcwd()
+    os.chdir(path)
+    try:
+        for _ in range(repeat):
+            repositories = time_stage(stages, 'get_maven_dirs', script.get_maven_dirs, './')
+            repository_urls = {}
+            repository_dependency_info = time_stage(stages, 'read_dependency_info', script.read_dependency_info, repositories, DEPENDENCY_TREE_OUTPUT, GROUP_ID, None, None, repository_urls)
+            # The grouping consumes nothing from its input but copy anyway so every repeat starts equal.
+            groups = time_stage(stages, 'create_non_version_dependency_groups', script.create_non_version_dependency_groups, dict(repository_dependency_info))
+            time_stage(stages, 'html_report', script.create_non_version_dependency_groups_html_report, groups, repository_urls)
+            time_stage(stages, 'json_report', write_json_report, repository_dependency_info)
+        # Bytes held by the dependency information itself, shared strings and records counted once.
+        memory['dependency_info_bytes'] = deep_size(repository_dependency_info)
+    finally:
+        os.chdir(current_directory)
+    return stages, memory, len(groups)
+
+
+def compare_results(previous_file, results):
+    with open(previous_file, 'r') as f:
+        previous = json.load(f)
+    previous_by_size = dict((entry['repositories'], entry['stages']) for entry in previous['results'])
+    previous_memory_by_size = dict((entry['repositories'], entry.get('memory', {})) for entry in previous['results'])
+    print ''
+    print 'Comparison with {}'.format(previous_file)
+    print '{:>8}  {:<40}{:>12}{:>12}{:>9}'.format('repos', 'stage', 'previous', 'current', 'ratio')
+    for entry in results:
+        previous_stages = previous_by_size.get(entry['repositories'])
+        if not previous_stages:
+            continue
+        for stage, seconds in sorted(entry['stages'].iteritems()):
+            if stage in previous_stages and previous_stages[stage] > 0:
+                print '{:>8}  {:<40}{:>12.4f}{:>12.4f}{:>9.2f}'.format(entry['repositories'], stage, previous_stages[stage], seconds, seconds / previous_stages[stage])
+        previous_memory = previous_memory_by_size.get(entry['repositories'], {})
+        for measure, used_bytes in sorted(entry['memory'].iteritems()):
+            if previous_memory.get(measure):
+                print '{:>8}  {:<40}{:>11.1f}M{:>11.1f}M{:>9.2f}'.format(entry['repositories'], measure, previous_memory[measure] / 1e6, used_bytes / 1e6, float(used_bytes) / previous_memory[measure])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes',   default='10,100,1000,10000', help='Comma separated repository counts. Defaults to 10,100,1000,10000')
+    parser.add_argument('-r', '--repeat',  default=3, type=int,           help='Runs per size, the fastest is reported. Defaults to 3')
+    parser.add_argument('--seed',          default=2017, type=int,        help='Seed of the workspace generator. Defaults to 2017')
+    parser.add_argument('-o', '--output',  default='benchmark_results.json', help='JSON results file. Defaults to benchmark_results.json')
+    parser.add_argument('-c', '--compare',                                help='Previous results file to compare against.')
+    parser.add_argument('-k', '--keep',    action='store_true',           help='Keep the generated workspaces.')
+    args = parser.parse_args()
+
+    script = load_dependency_script()
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        path = tempfile.mkdtemp(prefix='dependency_benchmark_{}_'.format(size))
+        try:
+            start = time.time()
+            generate_workspace(path, size, args.seed)
+            print 'Generated {} repositories in {:.2f} seconds ({})'.format(size, time.time() - start, path)
+            sys.stdout.flush()
+            stages, memory, group_count = benchmark_workspace(script, path, args.repeat)
+            for stage, seconds in sorted(stages.iteritems()):
+                print '    {:<40}{:>10.4f} seconds'.format(stage, seconds)
+            for measure, used_bytes in sorted(memory.iteritems()):
+                print '    {:<40}{:>10.1f} MB'.format(measure, used_bytes / 1e6)
+            sys.stdout.flush()
+            results.append({'repositories': size, 'build_groups': group_count, 'stages': stages, 'memory': memory})
+        finally:
+            if not args.keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    report = {'created': time.strftime('%Y-%m-%d_%H_%M_%S'), 'python': platform.python_version(), 'platform': platform.platform(),
+              'seed': args.seed, 'repeat': args.repeat, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, sort_keys=True, indent=2)
+    print 'Results written to {}'.format(args.output)
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Builds the repositories in dependency order. A repository starts as soon as everything it depends on is built.
+
+import os
+import sys
+import time
+import Queue
+import platform
+import threading
+import subprocess
+
+BUILT = 'built'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+NOT_STARTED = 'not started'
+
+
+def build_repository(repository, build_command, log_dir):
+    # Returns (return code, seconds)
+    start = time.time()
+    with open(os.path.join(log_dir, '{}.log'.format(repository)), 'w') as log:
+        try:
+            p = subprocess.Popen(build_command, cwd=repository, stdout=log, stderr=subprocess.STDOUT, shell=(platform.system() == 'Windows'))
+            returncode = p.wait()
+        except OSError as e:
+            log.write('Unable to run {}: {}\n'.format(' '.join(build_command), e))
+            returncode = -1
+    return returncode, time.time() - start
+
+
+def find_critical_path(results, upstream):
+    # Walk back from the repository that finished last, always through the upstream repository
+    # that finished last, which is the one that actually held the build back.
+    finished = dict((repository, result) for repository, result in results.iteritems() if result['status'] in (BUILT, FAILED))
+    if not finished:
+        return []
+    repository = max(finished, key=lambda r: finished[r]['end'])
+    path = [repository]
+    while True:
+        predecessors = [r for r in upstream.get(repository, {}) if r in finished]
+        if not predecessors:
+            break
+        repository = max(predecessors, key=lambda r: finished[r]['end'])
+        path.append(repository)
+    path.reverse()
+    return path
+
+
+def execute_builds(repositories, upstream, downstream, build_command, jobs=4, keep_going=False, log_dir='build_logs'):
+    # repositories are the repositories to build. upstream and downstream are the graphs from compute_build_groups.
+    # Returns {repository: {'status', 'returncode', 'seconds', 'start', 'end'}} with start and end relative to the run.
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    repositories = set(repositories)
+    pending_count = dict((repository, len([r for r in upstream[repository] if r in repositories])) for repository in repositories)
+    results = dict((repository, {'status': NOT_STARTED, 'returncode': None, 'seconds': 0.0, 'start': None, 'end': None}) for repository in repositories)
+    ready = sorted(repository for repository, count in pending_count.iteritems() if count == 0)
+    completed = Queue.Queue()
+    run_start = time.time()
+    running = 0
+    stopping = False
+
+    def worker(repository):
+        returncode, seconds = build_repository(repository, build_command, log_dir)
+        completed.put((repository, returncode, seconds))
+
+    def skip_dependents(repository):
+        pending = list(downstream[repository])
+        while pending:
+            dependent = pending.pop()
+            if dependent in results and results[dependent]['status'] == NOT_STARTED:
+                results[dependent]['status'] = SKIPPED
+                pending.extend(downstream[dependent])
+
+    while ready or running:
+        while ready and running < jobs and not stopping:
+            repository = ready.pop(0)
+            results[repository]['start'] = time.time() - run_start
+            print 'Building {}'.format(repository)
+            sys.stdout.flush()
+            thread = threading.Thread(target=worker, args=(repository,))
+            thread.daemon = True
+            thread.start()
+            running += 1
+        if not running:
+            break
+        repository, returncode, seconds = completed.get()
+        running -= 1
+        result = results[repository]
+        result['returncode'] = returncode
+        result['seconds'] = seconds
+        result['end'] = time.time() - run_start
+        if returncode == 0:
+            result['status'] = BUILT
+            print 'Built {} in {:.1f} seconds'.format(repository, seconds)
+            for dependent in downstream[repository]:
+                if dependent in pending_count:
+                    pending_count[dependent] -= 1
+                    if pending_count[dependent] == 0 and results[dependent]['status'] == NOT_STARTED:
+                        ready.append(dependent)
+            ready.sort()
+        else:
+            result['status'] = FAILED
+            print 'FAILED {} after {:.1f} seconds, see {}'.format(repository, seconds, os.path.join(log_dir, '{}.log'.format(repository)))
+            skip_dependents(repository)
+            if not keep_going:
+                # Let the running builds finish but start nothing new.
+                stopping = True
+        sys.stdout.flush()
+    return results
+
+
+def print_build_summary(results, upstream):
+    counts = {}
+    for result in results.itervalues():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print ''
+    print 'Builds: {} built, {} failed, {} skipped, {} not started'.format(counts.get(BUILT, 0), counts.get(FAILED, 0), counts.get(SKIPPED, 0), counts.get(NOT_STARTED, 0))
+    for repository in sorted(r for r, result in results.iteritems() if result['status'] == FAILED):
+        print '    failed: {}'.format(repository)
+    critical_path = find_critical_path(results, upstream)
+    if critical_path:
+        print ''
+        print 'Critical path ({:.1f} seconds of build time, {:.1f} seconds elapsed):'.format(
+            sum(results[r]['seconds'] for r in critical_path), max(results[r]['end'] for r in critical_path))
+        for repository in critical_path:
+            print '    {:<60}{:>10.1f} seconds'.format(repository, results[repository]['seconds'])
+    sys.stdout.flush()
+    return critical_path
@@ -0,0 +1,131 @@
+# Critical path schedule of the build order weighted by the recorded build time of every repository.
+
+import os
+import json
+
+from file_utils import atomic_write
+
+# Slack below this is treated as 0, the times are sums of floats.
+SLACK_TOLERANCE = 1e-6
+# update_build_timings averages over at most this many builds so the time follows recent changes.
+MAX_AVERAGED_BUILDS = 10
+
+
+def read_build_timings(file_name):
+    # Returns {repository: seconds}, empty when the file does not exist. Accepts {repository: seconds},
+    # {repository: {'seconds', 'builds'}} as written by update_build_timings, and the build_results.json of --build.
+    if not file_name or not os.path.isfile(file_name):
+        return {}
+    with open(file_name, 'r') as f:
+        timings = json.load(f)
+    if 'results' in timings and isinstance(timings['results'], dict):
+        # build_results.json of build_executor. Only complete builds say how long a build takes.
+        return dict((repository, float(result['seconds'])) for repository, result in timings['results'].iteritems() if result.get('status') == 'built')
+    build_timings = {}
+    for repository, value in timings.iteritems():
+        if isinstance(value, dict):
+            value = value.get('seconds')
+        if isinstance(value, (int, long, float)):
+            build_timings[repository] = float(value)
+    return build_timings
+
+
+def update_build_timings(file_name, results):
+    # Fold the successful builds of an execute_builds run into the timings file.
+    timings = {}
+    if os.path.isfile(file_name):
+        with open(file_name, 'r') as f:
+            timings = json.load(f)
+    for repository, result in results.iteritems():
+        if result['status'] != 'built':
+            continue
+        previous = timings.get(repository)
+        if isinstance(previous, dict):
+            builds = min(previous.get('builds', 1), MAX_AVERAGED_BUILDS - 1)
+            seconds = (previous['seconds'] * builds + result['seconds']) / (builds + 1)
+            timings[repository] = {'seconds': seconds, 'builds': builds + 1}
+        elif isinstance(previous, (int, long, float)):
+            timings[repository] = {'seconds': (previous + result['seconds']) / 2.0, 'builds': 2}
+        else:
+            timings[repository] = {'seconds': result['seconds'], 'builds': 1}
+    with atomic_write(file_name) as f:
+        json.dump(timings, f, sort_keys=True, indent=2)
+
+
+def _median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def compute_build_schedule(groups, upstream, downstream, build_timings):
+    # groups, upstream and downstream come from compute_build_groups. Only placed repositories are scheduled.
+    # The groups are already in topological order so one pass forward and one pass back are enough.
+    order = [repository for group in groups for repository in group]
+    scheduled = set(order)
+    default_duration = _median([build_timings[r] for r in order if r in build_timings])
+    if default_duration is None:
+        default_duration = 1.0
+
+    repositories = {}
+    for repository in order:
+        estimated = repository not in build_timings
+        duration = default_duration if estimated else build_timings[repository]
+        earliest_start = max([repositories[r]['earliest_finish'] for r in upstream[repository] if r in scheduled] or [0.0])
+        repositories[repository] = {'duration': duration, 'estimated': estimated,
+                                    'earliest_start': earliest_start, 'earliest_finish': earliest_start + duration}
+    makespan = max([schedule['earliest_finish'] for schedule in repositories.itervalues()] or [0.0])
+
+    for repository in reversed(order):
+        schedule = repositories[repository]
+        schedule['latest_finish'] = min([repositories[r]['latest_start'] for r in downstream[repository] if r in scheduled] or [makespan])
+        schedule['latest_start'] = schedule['latest_finish'] - schedule['duration']
+        schedule['slack'] = schedule['latest_start'] - schedule['earliest_start']
+        schedule['critical'] = schedule['slack'] < SLACK_TOLERANCE
+
+    # Walk back from the repository that finishes last through the upstream repository that holds it back.
+    critical_path = []
+    if repositories:
+        repository = max(order, key=lambda r: (repositories[r]['earliest_finish'], r))
+        while repository is not None:
+            critical_path.append(repository)
+            predecessors = [r for r in upstream[repository] if r in scheduled]
+            repository = max(predecessors, key=lambda r: (repositories[r]['earliest_finish'], r)) if predecessors else None
+        critical_path.reverse()
+
+    # Making a critical path repository faster shortens the whole build, the longest ones pay off most.
+    speed_up_first = sorted(critical_path, key=lambda r: (-repositories[r]['duration'], r))
+    return {'makespan': makespan,
+            'total_build_seconds': sum(schedule['duration'] for schedule in repositories.itervalues()),
+            'default_duration': default_duration,
+            'estimated_repositories': sorted(r for r, schedule in repositories.iteritems() if schedule['estimated']),
+            'critical_path': critical_path,
+            'speed_up_first': speed_up_first,
+            'repositories': repositories}
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    return '{}:{:02d}'.format(seconds // 60, seconds % 60)
+
+
+def print_build_schedule(build_schedule, count=10):
+    print 'Estimated makespan {} ({} of build time), {} repositories on the critical path, {} without a recorded build time.'.format(
+        format_duration(build_schedule['makespan']), format_duration(build_schedule['total_build_seconds']),
+        len(build_schedule['critical_path']), len(build_schedule['estimated_repositories']))
+    if build_schedule['speed_up_first']:
+        print 'Speed up first:'
+        for repository in build_schedule['speed_up_first'][:count]:
+            schedule = build_schedule['repositories'][repository]
+            print '    {:<60}{:>10}{}'.format(repository, format_duration(schedule['duration']), ' (estimated)' if schedule['estimated'] else '')
+
+
+def write_build_schedule(build_schedule, file_name):
+    with atomic_write(file_name) as f:
+        json.dump(build_schedule, f, sort_keys=True, indent=2)
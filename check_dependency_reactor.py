@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# Checks the reactor maven mode of multi-repository-dependency.py against a fake mvn that prints canned
+# dependency trees: the per repository files must match the ones the repository mode writes, failures stay
+# per repository and --resume only runs maven over what is left.
+#
+# Example
+#     ./check_dependency_reactor.py
+
+import os
+import sys
+import imp
+import json
+import shutil
+import tempfile
+import subprocess
+from StringIO import StringIO
+
+from run_journal import RunJournal
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEPENDENCY_TREE_OUTPUT = 'dependency_tree'
+PLUGIN_VERSION = '3.0.2'
+
+# {repository: [(module directory, artifactId)]}, the first module is the pom of the repository itself.
+REPOSITORIES = {'api-lib': [('', 'api-lib')],
+                'service': [('', 'service-parent'), ('service-api', 'service-api'), ('service-impl', 'service-impl')],
+                'broken': [('', 'broken')]}
+# What the fake mvn prints for every artifactId.
+CANNED_TREES = {'api-lib': ['com.dell.cpsd:api-lib:jar:1.0.0',
+                            '\\- org.slf4j:slf4j-api:jar:1.7.25:compile'],
+                'service-parent': ['com.dell.cpsd:service-parent:pom:2.0.0'],
+                'service-api': ['com.dell.cpsd:service-api:jar:2.0.0',
+                                '\\- com.dell.cpsd:api-lib:jar:1.0.0:compile',
+                                '   \\- org.slf4j:slf4j-api:jar:1.7.25:compile'],
+                'service-impl': ['com.dell.cpsd:service-impl:jar:2.0.0',
+                                 '+- com.dell.cpsd:service-api:jar:2.0.0:compile',
+                                 '|  \\- com.dell.cpsd:api-lib:jar:1.0.0:compile',
+                                 '\\- com.google.guava:guava:jar:20.0:compile']}
+# artifactIds the fake mvn fails on, like a module whose dependencies can not be resolved.
+FAILING = ['broken']
+
+FAKE_MVN = '''import os
+import re
+import sys
+import json
+
+TREES = json.loads({trees!r})
+FAILING = json.loads({failing!r})
+
+arguments = sys.argv[1:]
+pom = arguments[arguments.index('-f') + 1] if '-f' in arguments else 'pom.xml'
+output = [argument.split('=', 1)[1] for argument in arguments if argument.startswith('-DoutputFile=')][0]
+failed = []
+
+
+def run(pom):
+    with open(pom) as f:
+        text = f.read()
+    artifact_id = re.search('<artifactId>([^<]+)</artifactId>', text).group(1)
+    with open({log!r}, 'a') as log:
+        log.write(artifact_id + '\\n')
+    if artifact_id in FAILING:
+        print('[ERROR] Could not resolve dependencies for project ' + artifact_id)
+        failed.append(artifact_id)
+        return
+    if artifact_id in TREES:
+        with open(os.path.join(os.path.dirname(pom), output), 'w') as f:
+            f.write('\\n'.join(TREES[artifact_id]) + '\\n')
+    for module in re.findall('<module>([^<]+)</module>', text):
+        run(os.path.join(os.path.dirname(pom), module, 'pom.xml'))
+
+
+run(pom)
+sys.exit(1 if failed else 0)
+'''
+
+
+def load_dependency_script():
+    # The script name has a dash in it so it can not be imported the normal way.
+    return imp.load_source('multi_repository_dependency', os.path.join(SCRIPT_DIRECTORY, 'multi-repository-dependency.py'))
+
+
+def git(directory, *arguments):
+    subprocess.check_call(['git', '-c', 'user.name=check', '-c', 'user.email=check@localhost'] + list(arguments), cwd=directory, stdout=open(os.devnull, 'w'))
+
+
+def generate_workspace(path):
+    for repository, modules in sorted(REPOSITORIES.iteritems()):
+        for directory, artifact_id in modules:
+            module_directory = os.path.join(path, repository, directory)
+            if not os.path.isdir(module_directory):
+                os.makedirs(module_directory)
+            with open(os.path.join(module_directory, 'pom.xml'), 'w') as pom:
+                pom.write('<project>\n')
+                pom.write('    <modelVersion>4.0.0</modelVersion>\n')
+                pom.write('    <groupId>com.dell.cpsd</groupId>\n')
+                pom.write('    <artifactId>{}</artifactId>\n'.format(artifact_id))
+                pom.write('    <version>1.0.0</version>\n')
+                if not directory and len(modules) > 1:
+                    pom.write('    <packaging>pom</packaging>\n')
+                    pom.write('    <modules>\n')
+                    for module_directory_name, module_artifact_id in modules[1:]:
+                        pom.write('        <module>{}</module>\n'.format(module_directory_name))
+                    pom.write('    </modules>\n')
+                pom.write('</project>\n')
+        repository_directory = os.path.join(path, repository)
+        git(repository_directory, 'init', '-q')
+        git(repository_directory, 'remote', 'add', 'origin', 'https://github.com/dellemc-symphony/{}.git'.format(repository))
+        git(repository_directory, 'add', '-A')
+        git(repository_directory, 'commit', '-q', '-m', 'Initial commit')
+
+
+def write_fake_mvn(path, log_file):
+    fake_mvn = os.path.join(path, 'fake_mvn.py')
+    with open(fake_mvn, 'w') as f:
+        f.write(FAKE_MVN.format(trees=json.dumps(CANNED_TREES), failing=json.dumps(FAILING), log=log_file))
+    return '"{}" "{}"'.format(sys.executable, fake_mvn)
+
+
+def read_log(log_file):
+    # artifactIds the fake mvn was run over since the last call.
+    if not os.path.isfile(log_file):
+        return []
+    with open(log_file) as f:
+        artifact_ids = f.read().split()
+    os.remove(log_file)
+    return artifact_ids
+
+
+def read_dependency_files(path):
+    dependency_files = {}
+    for repository in REPOSITORIES:
+        file_name = os.path.join(path, '{}.{}'.format(repository, DEPENDENCY_TREE_OUTPUT))
+        if os.path.isfile(file_name):
+            with open(file_name) as f:
+                dependency_files[repository] = f.read()
+    return dependency_files
+
+
+def run_quietly(path, function, *args):
+    # The update functions print their progress, only the checks are of interest here.
+    current_directory = os.getcwd()
+    stdout = sys.stdout
+    os.chdir(path)
+    sys.stdout = StringIO()
+    try:
+        return function(*args)
+    finally:
+        sys.stdout = stdout
+        os.chdir(current_directory)
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print '{} {}'.format('ok    ' if condition else 'FAILED', message)
+        if not condition:
+            failures.append(message)
+
+    script = load_dependency_script()
+    directory = tempfile.mkdtemp(prefix='dependency_reactor_')
+    reactor_workspace = os.path.join(directory, 'reactor')
+    repository_workspace = os.path.join(directory, 'repository')
+    log_file = os.path.join(directory, 'fake_mvn.log')
+    journal_file = os.path.join(directory, 'journal.jsonl')
+    try:
+        maven_command = write_fake_mvn(directory, log_file)
+        generate_workspace(reactor_workspace)
+        shutil.copytree(reactor_workspace, repository_workspace)
+        repositories = sorted(REPOSITORIES)
+
+        journal = RunJournal(journal_file)
+        try:
+            summary = run_quietly(reactor_workspace, script.create_update_dependency_files_reactor, repositories, PLUGIN_VERSION, DEPENDENCY_TREE_OUTPUT, maven_command, None, journal)
+        finally:
+            journal.close()
+        check(read_log(log_file)[0] == 'dependency-tree-reactor', 'reactor mode runs maven once over an aggregator pom')
+        check(summary['refreshed'] == ['api-lib', 'service'] and summary['failed'] == ['broken'], 'a failing repository does not fail the others {}'.format(summary))
+        check(not os.path.exists(os.path.join(reactor_workspace, '.dependency_tree_reactor.xml')), 'the aggregator pom is removed afterwards')
+
+        summary = run_quietly(repository_workspace, script.create_update_dependency_files, repositories, PLUGIN_VERSION, DEPENDENCY_TREE_OUTPUT, 1, None, None, maven_command)
+        read_log(log_file)
+        check(summary['refreshed'] == ['api-lib', 'service'] and summary['failed'] == ['broken'], 'repository mode gives the same result {}'.format(summary))
+        reactor_files = read_dependency_files(reactor_workspace)
+        check(sorted(reactor_files) == ['api-lib', 'service'], 'reactor mode writes a dependency file per repository')
+        check(reactor_files == read_dependency_files(repository_workspace), 'the dependency files are the same as in repository mode')
+
+        dependency_info = run_quietly(reactor_workspace, script.read_dependency_info, sorted(reactor_files), DEPENDENCY_TREE_OUTPUT, 'com.dell.cpsd')
+        groups = script.compute_build_groups(dependency_info)[0]
+        check(groups == [['api-lib'], ['service']], 'the dependency files give the build order {}'.format(groups))
+
+        journal = RunJournal(journal_file, resume=True)
+        try:
+            summary = run_quietly(reactor_workspace, script.create_update_dependency_files_reactor, repositories, PLUGIN_VERSION, DEPENDENCY_TREE_OUTPUT, maven_command, None, journal)
+        finally:
+            journal.close()
+        check(read_log(log_file) == ['dependency-tree-reactor', 'broken'], 'with --resume maven only runs over the failed repository')
+        check(summary['skipped'] == ['api-lib', 'service'] and summary['failed'] == ['broken'], 'with --resume the finished repositories are skipped {}'.format(summary))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# Checks repository_discovery against a local stub of the GitHub organization API: paging,
+# conditional requests answered with 304 from the listing cache, and the login check.
+#
+# Example
+#     ./check_repository_discovery.py
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import urlparse
+import BaseHTTPServer
+
+from repository_discovery import DiscoveryError, ListingCache, check_login, create_session, iter_org_repository_pages
+
+TOKEN = 'stub-token'
+ORGANIZATION = 'stub-org'
+PAGE_SIZE = 100
+
+
+class StubGitHub(object):
+
+    def __init__(self, repository_count, links_on_304=True):
+        self.names = ['repo-{:04d}'.format(number) for number in range(repository_count)]
+        self.links_on_304 = links_on_304
+        self.requests = 0
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), self.handler())
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def page(self, number):
+        names = self.names[(number - 1) * PAGE_SIZE:number * PAGE_SIZE]
+        return names, '"{}"'.format(abs(hash(tuple(names))))
+
+    def page_url(self, number):
+        return '{}/orgs/{}/repos?type=all&per_page={}&page={}'.format(self.url, ORGANIZATION, PAGE_SIZE, number)
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                stub.requests += 1
+                if self.headers.get('Authorization') != 'token {}'.format(TOKEN):
+                    return self.send(401, {'message': 'Bad credentials'})
+                url = urlparse.urlparse(self.path)
+                if url.path == '/orgs/{}'.format(ORGANIZATION):
+                    return self.send(200, {'login': ORGANIZATION})
+                if url.path != '/orgs/{}/repos'.format(ORGANIZATION):
+                    return self.send(404, {'message': 'Not Found'})
+                number = int(urlparse.parse_qs(url.query).get('page', ['1'])[0])
+                names, etag = stub.page(number)
+                headers = {'ETag': etag}
+                # Like GitHub every page but the only one links to its neighbours.
+                links = []
+                if number > 1:
+                    links.append('<{}>; rel="prev"'.format(stub.page_url(number - 1)))
+                if number * PAGE_SIZE < len(stub.names):
+                    links.append('<{}>; rel="next"'.format(stub.page_url(number + 1)))
+                if links:
+                    headers['Link'] = ', '.join(links)
+                if self.headers.get('If-None-Match') == etag:
+                    if not stub.links_on_304:
+                        headers.pop('Link', None)
+                    return self.send(304, None, headers)
+                self.send(200, [{'name': name} for name in names], headers)
+
+            def send(self, code, body, headers=None):
+                data = json.dumps(body) if body is not None else ''
+                self.send_response(code)
+                for name, value in (headers or {}).iteritems():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def list_names(stub, cache_file):
+    cache = ListingCache(cache_file)
+    stats = {}
+    names = []
+    for page_names in iter_org_repository_pages(create_session(token=TOKEN), stub.url, ORGANIZATION, cache, stats):
+        names.extend(page_names)
+    cache.save()
+    return names, stats
+
+
+def check_listing(check, stub):
+    directory = tempfile.mkdtemp(prefix='repository_discovery_')
+    cache_file = os.path.join(directory, 'listing_cache.json')
+    try:
+        names, stats = list_names(stub, cache_file)
+        check(names == stub.names, 'first listing returns all {} repositories'.format(len(stub.names)))
+        page_count = len(stub.names) // PAGE_SIZE + 1 if len(stub.names) % PAGE_SIZE else len(stub.names) // PAGE_SIZE
+        check(stats == {'requests': page_count, 'not_modified': 0}, 'first listing requests every page in full {}'.format(stats))
+
+        names, stats = list_names(stub, cache_file)
+        check(names == stub.names, 'second listing returns the same repositories from the cache')
+        check(stats['not_modified'] == page_count, 'second listing gets 304 for every page {}'.format(stats))
+
+        stub.names.append('repo-new')
+        names, stats = list_names(stub, cache_file)
+        check(names == stub.names, 'a new repository on the last page is listed')
+        check(stats['requests'] - stats['not_modified'] == 1, 'only the changed or new page is fetched again {}'.format(stats))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    failures = []
+
+    def check(condition, message):
+        print '{} {}'.format('ok    ' if condition else 'FAILED', message)
+        if not condition:
+            failures.append(message)
+
+    stub = StubGitHub(250)
+    try:
+        check_login(create_session(token=TOKEN), stub.url, ORGANIZATION)
+        check(True, 'login with a valid token')
+        try:
+            check_login(create_session(token='wrong'), stub.url, ORGANIZATION)
+            check(False, 'login with a bad token fails')
+        except DiscoveryError:
+            check(True, 'login with a bad token fails')
+    finally:
+        stub.server.shutdown()
+
+    # A partial last page, full last pages with and without the Link header on 304 responses.
+    for repository_count, links_on_304 in ((250, True), (200, True), (200, False)):
+        print '{} repositories, {} Link header on 304'.format(repository_count, 'with' if links_on_304 else 'without')
+        stub = StubGitHub(repository_count, links_on_304)
+        try:
+            check_listing(check, stub)
+        finally:
+            stub.server.shutdown()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,16 +5,24 @@ Created on Apr 10, 2017
 @author: rousef
 '''
 import os
+import re
 import sys
 import time
+import shutil
+import signal
 import argparse
-import github3
-import platform
+import threading
 import subprocess
+from run_report import RunReport, run_profiled
+from run_journal import FAILED, RunJournal
+from git_access import read_head_sha
+from sync_pipeline import run_sync_pipeline
+from workspace_scanner import scan_workspace
+from rate_limit import install_rate_limiter, print_api_usage
+from repository_discovery import DiscoveryError, ListingCache, check_login, create_session, get_github_api_url, iter_org_repository_pages
 from ConfigParser import ConfigParser
 from chainmap import  ChainMap
 from StringIO import StringIO
-from github3.repos import repo
 
 # In order to better use this program store your credentials in the git hub store.
 # Follow the list of commands below.
@@ -32,6 +40,10 @@ from github3.repos import repo
 # If you are on a shared machine put a timeout on how long git will cache the credentials like below
 # git config --global credential.helper 'cache --timeout=3600'
 
+# What git clone --single-branch --branch and git fetch print for a branch the remote does not have.
+MISSING_BRANCH = re.compile(r"Remote branch .* not found|couldn't find remote ref")
+
+
 def getArguments():
     # Program Internal settings
     # I know that it is slower to load this way but it is more explicit and readable in my opinion
@@ -43,6 +55,16 @@ def getArguments():
     program_defaults['giteos2_certs']        = '/opt/security/EMC_CA_GIT_HUB_Combo.pem'
     program_defaults['root_parent_version']  = '1.1.0'
     program_defaults['git_branch']           = 'master'
+    program_defaults['jobs']                 = '1'
+    program_defaults['git_timeout']          = '600'
+    program_defaults['git_retries']          = '2'
+    program_defaults['git_retry_backoff']    = '5'
+    program_defaults['clone_depth']          = '0'
+    program_defaults['listing_cache_file']   = '.org_listing_cache.json'
+    program_defaults['journal_file']         = '.checkout_journal.jsonl'
+    program_defaults['workspace_cache_file'] = '.workspace_scan_cache.json'
+    program_defaults['api_requests_per_second'] = '10'
+    program_defaults['api_burst']            = '20'
 
     # Property File settings
     property_file_name = os.path.splitext(os.path.basename(__file__))[0] + '.props'
@@ -71,6 +93,27 @@ def getArguments():
     parser.add_argument('-eos2o', '--giteos2_organization', help='eos2 source organization. Default: ' + program_defaults['giteos2_organization'])
     parser.add_argument('-rpv', '--root_parent_version',    help='The root-parent version used in the generated maven parent pom.xml.')
     parser.add_argument('-gb', '--git_branch',              help='The git branch that should be checkout in each repository.')
+    parser.add_argument('-j', '--jobs',                     help='Number of repositories to clone/update at the same time. Default: ' + program_defaults['jobs'])
+    parser.add_argument('-gto', '--git_timeout',            help='Seconds before a single git clone/pull is killed. Default: ' + program_defaults['git_timeout'])
+    parser.add_argument('-gr', '--git_retries',             help='Number of times a failed git clone/pull is retried. Default: ' + program_defaults['git_retries'])
+    parser.add_argument('-grb', '--git_retry_backoff',      help='Seconds to wait before the first retry, doubled on each further retry. Default: ' + program_defaults['git_retry_backoff'])
+    parser.add_argument('-gau', '--github_api_url',         help='Github API URL. Default: derived from --github_url')
+    parser.add_argument('-eos2au', '--giteos2_api_url',     help='eos2 API URL. Default: derived from --giteos2_url')
+    parser.add_argument('-arps', '--api_requests_per_second', help='Most API requests per second to one host, lowered automatically to make the rate limit last. Default: ' + program_defaults['api_requests_per_second'])
+    parser.add_argument('-ab', '--api_burst',               help='Number of API requests that can be sent at once before the pacing starts. Default: ' + program_defaults['api_burst'])
+    parser.add_argument('-r', '--resume',                   help='Skip repositories the previous run synced and that are still at the same sha, retry the rest.', action='store_true')
+    parser.add_argument('-jf', '--journal_file',            help='Per repository progress of the run, read back by --resume. Default: ' + program_defaults['journal_file'])
+    parser.add_argument('-lcf', '--listing_cache_file',     help='File caching organization listings between runs. Default: ' + program_defaults['listing_cache_file'])
+    parser.add_argument('-wcf', '--workspace_cache_file',   help='Cache of the pom, HEAD and remote of every repository directory, shared with multi-repository-dependency.py. Default: ' + program_defaults['workspace_cache_file'])
+    parser.add_argument('-gj', '--github_jobs',             help='Number of github repositories to clone/update at the same time. Default: --jobs')
+    parser.add_argument('-eos2j', '--giteos2_jobs',         help='Number of eos2 repositories to clone/update at the same time. Default: --jobs')
+    parser.add_argument('-rr', '--run_report',              help='Write per stage and per repository timings to this file. A .csv name writes CSV, anything else JSON.')
+    parser.add_argument('-prof', '--profile',               help='Write a cProfile dump of the run to this file.')
+    parser.add_argument('-cd', '--clone_depth',             help='Only clone/fetch this many commits of history. 0 clones the full history. Default: ' + program_defaults['clone_depth'])
+    parser.add_argument('-cf', '--clone_filter',            help='Partial clone filter passed to git, for example blob:none.')
+    parser.add_argument('-csb', '--single_branch',          help='Clone only the --git_branch branch of each repository.', action='store_true')
+    parser.add_argument('-cr', '--clone_reference',         help='Local repository used as a shared object store for new clones.')
+    parser.add_argument('-fu', '--fast_update',             help='Update existing clones by fetching only --git_branch and resetting to it, discarding local changes.', action='store_true')
     namespace = parser.parse_args()
     # Create a dictionary of the given parser command line inputs
     command_line_args = {k:v for k,v in vars(namespace).items() if v}
@@ -78,103 +121,160 @@ def getArguments():
     # Now create a chainmap of all the dictionaries in the order of precedence.
     return ChainMap(command_line_args, os.environ, property_file_properties, program_defaults)
 
-def gitHubConnect(args):
+def install_api_rate_limiter(session, url, args, report=None, pool_maxsize=10):
+    return install_rate_limiter(session, url, float(args['api_requests_per_second']), int(args['api_burst']), report=report, pool_maxsize=pool_maxsize)
+
+def gitHubLogin(session, api_url, args):
     try:
-        # If given use the authentication token
-        if 'github_authtoken' in args:
-            gh = github3.login(token=args['github_authtoken'])
-        else:
-            gh = github3.login(username=args['github_username'], password=args['github_password'])
-        # Log into the organization used by this operation.
-        gh.organization(args['github_organization'])
-    except: 
+        check_login(session, api_url, args['github_organization'])
+    except DiscoveryError as e:
+        print e
         print 'Unable to login with given credentials.'
         if 'github_authtoken' in args:
             print 'Github authentication token = "{}"'.format(args['github_authtoken'])
         else:
-            print 'Github user name            = "{}"'.format(args['github_username'])
-            print 'Github password             = "{}"'.format(args['github_password'])
+            print 'Github user name            = "{}"'.format(args.get('github_username'))
+            print 'Github password             = "{}"'.format(args.get('github_password'))
         print 'Github organization         = "{}"'.format(args['github_organization'])
         exit(1)
-    return gh
 
-def gitEnterpriseConnect(args):
+def gitEnterpriseLogin(session, api_url, args):
     try:
-        # If given use the authentication token
-        if 'giteos2_authtoken' in args:
-            ghe = github3.GitHubEnterprise(url=args['giteos2_url'], token=args['giteos2_authtoken'], verify=args['giteos2_certs'])
-        else:
-            ghe = github3.GitHubEnterprise(url=args['giteos2_url'], username=args['giteos2_username'], password=args['giteos2_password'], verify=args['giteos2_certs'])
-        # Log into the organization used by this operation.
-        ghe.organization(args['giteos2_organization'])
-    except:
+        check_login(session, api_url, args['giteos2_organization'])
+    except DiscoveryError as e:
+        print e
         print 'Unable to login with given credentials.'
         print 'Github Enterprise url                  = "{}"'.format(args['giteos2_url'])
         if 'giteos2_authtoken' in args:
             print 'Github Enterprise authentication token = "{}"'.format(args['giteos2_authtoken'])
         else:
-            print 'Github Enterprise user name            = "{}"'.format(args['giteos2_username'])
-            print 'Github Enterprise password             = "{}"'.format(args['giteos2_password'])
+            print 'Github Enterprise user name            = "{}"'.format(args.get('giteos2_username'))
+            print 'Github Enterprise password             = "{}"'.format(args.get('giteos2_password'))
         print 'Github Enterprise organization         = "{}"'.format(args['giteos2_organization'])
         exit(1)
-    return ghe
 
-def getOrgRepos(gh, organization):
-    strip_space = len(organization) + 1
-    org = gh.organization(login=organization)
-    repos = []
-    for repo in org.iter_repos(type='all'):
-        bare_repo_name = str(repo)[strip_space:]
-        if bare_repo_name.startswith('rcm'):
-            repos.append(str(repo)[strip_space:])
-    return sorted(repos)
+def run_git_command(git_command, cwd=None, timeout=None):
+    # Run the command without a shell and in its own process group. On a timeout the whole group is killed,
+    # git helpers like git-remote-https hold on to the output pipe and would otherwise keep communicate() waiting.
+    if hasattr(os, 'setsid'):
+        p = subprocess.Popen(git_command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+    else:
+        p = subprocess.Popen(git_command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    timer = None
+    timed_out = []
+    if timeout:
+        def kill():
+            timed_out.append(True)
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(p.pid, signal.SIGKILL)
+                else:
+                    p.kill()
+            except OSError:
+                # Already finished.
+                pass
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        (output, err) = p.communicate()
+    finally:
+        if timer:
+            timer.cancel()
+    if timed_out:
+        output = (output or '') + 'Timed out after {} seconds\n'.format(timeout)
+        return p.returncode or 1, output
+    return p.returncode, output
 
-def getUserRepos(gh, organization):
-    strip_space = len(organization) + 1
-    user_repos = gh.iter_user_repos(login='rousef')
-    repos = []
-    for repo in user_repos:
-        bare_repo_name = str(repo)[strip_space:]
-        if bare_repo_name.startswith('rcm'):
-            repos.append(str(repo)[strip_space:])
-    return sorted(repos)
+def get_clone_command(repo, organization, url, branch, depth=0, clone_filter=None, single_branch=False, reference=None, **ignored):
+    git_command = ['git', 'clone']
+    if depth:
+        git_command += ['--depth', str(depth)]
+    if clone_filter:
+        git_command += ['--filter={}'.format(clone_filter)]
+    if single_branch:
+        git_command += ['--single-branch', '--branch', branch]
+    if reference:
+        git_command += ['--reference-if-able', reference]
+    git_command.append('{}/{}/{}.git'.format(url, organization, repo))
+    return git_command
 
-def clone_or_update_repos(repos, organization, url, branch):
-    maven_repos = []
-    cmd_sep = ';'
-    if platform.system() == 'Windows':
-        cmd_sep = '&'
-        
-    for repo in repos:
-        repo = repo.strip()
-        if os.path.isdir(repo):
-            print 'Pulling updates into repo {}'.format(repo)
-            sys.stdout.flush()
-            git_command = 'cd {} {cmd_sep} git pull'.format(repo, cmd_sep=cmd_sep)
-        else:
-            print 'Cloning repo {}'.format(repo)
-            sys.stdout.flush()
-            git_command = 'git clone {}/{}/{}.git'.format(url, organization, repo)
+def get_fast_update_commands(branch, depth=0, **ignored):
+    # Fetch only the branch being built and move the local branch onto it.
+    # The explicit refspec also works for single branch clones of a different branch.
+    fetch_command = ['git', 'fetch', 'origin', '+refs/heads/{0}:refs/remotes/origin/{0}'.format(branch)]
+    if depth:
+        fetch_command[2:2] = ['--depth', str(depth)]
+    return [fetch_command, ['git', 'checkout', '-f', '-B', branch, 'refs/remotes/origin/{}'.format(branch)]]
 
-#         git_command = '{} {cmd_sep} cd {repo} {cmd_sep} git checkout {branch} {cmd_sep} cd ..'.format(git_command, repo=repo, cmd_sep=cmd_sep, branch=branch)
+def clone_or_update_repo(repo, organization, url, branch, timeout=None, retries=0, retry_backoff=0, clone_options=None, report=None):
+    # Output is collected rather than printed so that concurrent repositories do not interleave.
+    # Returns (repo, success, output_lines)
+    clone_options = clone_options or {}
+    report = report or RunReport()
+    lines = []
+    repo = repo.strip()
+    cloning = not os.path.isdir(repo)
+    checkout_command = ['git', 'checkout', branch]
+    # Single branch clones and fast updates only fetch the branch, git fails them for repositories that do not have it.
+    branch_only = clone_options.get('single_branch') if cloning else clone_options.get('fast_update')
+    if cloning:
+        lines.append('Cloning repo {}'.format(repo))
+        git_commands = [get_clone_command(repo, organization, url, branch, **clone_options)]
+        cwd = None
+    elif branch_only:
+        lines.append('Fetching branch "{}" into repo {}'.format(branch, repo))
+        git_commands = get_fast_update_commands(branch, **clone_options)
+        checkout_command = None
+        cwd = repo
+    else:
+        lines.append('Pulling updates into repo {}'.format(repo))
+        git_commands = [['git', 'pull']]
+        cwd = repo
 
-        p = subprocess.Popen(git_command, stdout=subprocess.PIPE, shell=True)
-        (output, err) = p.communicate()
-        if p.returncode != 0:
-            return -1
+    attempt = 0
+    while True:
+        with report.timed('clone' if cloning else 'pull', repo, subprocess=True) as event:
+            for git_command in git_commands:
+                returncode, output = run_git_command(git_command, cwd=cwd, timeout=timeout)
+                if returncode != 0:
+                    event['status'] = 'failed'
+                    break
+        if returncode == 0:
+            break
+        if cloning and os.path.isdir(repo):
+            # Never leave a half finished clone behind as the next attempt would treat it as an existing repository.
+            shutil.rmtree(repo, ignore_errors=True)
+        if branch_only and output and MISSING_BRANCH.search(output):
+            # Not such a big deal. Print out a warning and fall back to the default branch, this is not a failed attempt.
+            lines.append('Repo {} does contain the branch "{}"'.format(repo, branch))
+            if cloning:
+                git_commands = [get_clone_command(repo, organization, url, branch, **dict(clone_options, single_branch=False))]
+            else:
+                lines.append('Pulling updates into repo {}'.format(repo))
+                git_commands = [['git', 'pull']]
+            branch_only = False
+            checkout_command = None
+            continue
+        lines.append('Command "{}" failed with return code {} (attempt {} of {})'.format(' '.join(git_command), returncode, attempt + 1, retries + 1))
+        if output:
+            lines.extend(output.rstrip().split('\n'))
+        if attempt >= retries:
+            return repo, False, lines
+        delay = retry_backoff * (2 ** attempt)
+        lines.append('Retrying in {} seconds'.format(delay))
+        time.sleep(delay)
+        attempt += 1
 
-        git_command = 'cd {repo} {cmd_sep} git checkout {branch}'.format(repo=repo, cmd_sep=cmd_sep, branch=branch )
-        p = subprocess.Popen(git_command, stdout=subprocess.PIPE, shell=True)
-        (output, err) = p.communicate()
-        if p.returncode != 0:
+    if checkout_command:
+        with report.timed('checkout', repo, subprocess=True) as event:
+            returncode, output = run_git_command(checkout_command, cwd=repo, timeout=timeout)
+            if returncode != 0:
+                event['status'] = 'failed'
+        if returncode != 0:
             # Not such a big deal that the command failed. Print out a warning and move on.
-            print 'Repo {} does contain the branch "{}"'.format(repo, branch)
+            lines.append('Repo {} does contain the branch "{}"'.format(repo, branch))
 
-        if os.path.exists('{}/pom.xml'.format(repo)):
-            maven_repos.append(repo)
-        print '--------------------------------------------------------------------------------'
-        sys.stdout.flush()
-    return maven_repos
+    return repo, True, lines
 
 def write_parent_pom(maven_repo_list, root_parent_version):
     # Save older versions of the pom for comparison later
@@ -208,48 +308,83 @@ def write_parent_pom(maven_repo_list, root_parent_version):
     pom.write('</project>\n')
     pom.close()
 
-def main():
+def main(args, report):
 
-    args = getArguments()
     # This is an abandoned repository that no longer builds
     excluded_maven_repos = ['engineering-standards-services']
     # Example repositories not meant to be built as part of the standard build.
     excluded_maven_repos += ['hello-world-docker-example', 'hello-world-usecase-rpm']
 
-    # Create a list of all of the github repositories
-    github_repos = []
-    github_source = gitHubConnect(args)
-    strip_space = len(args['github_organization']) + 1
-    github_org = github_source.organization(args['github_organization'])
-    for repo in github_org.iter_repos(type='all'):
-        github_repos.append(str(repo)[strip_space:])
-    github_repos = sorted(github_repos)
-
-    # Create a list of all of the eos2 repositories
+    # Listing and cloning overlap, see sync_pipeline. Each host gets its own number of clone workers.
+    cache = ListingCache(args['listing_cache_file'])
+    github_stats = {}
+    eos2_stats = {}
+    github_api_url = args.get('github_api_url') or get_github_api_url(args['github_url'])
+    github_session = create_session(token=args.get('github_authtoken'), username=args.get('github_username'), password=args.get('github_password'))
+    install_api_rate_limiter(github_session, github_api_url, args, report)
+    gitHubLogin(github_session, github_api_url, args)
+    eos2_api_url = args.get('giteos2_api_url') or get_github_api_url(args['giteos2_url'])
+    eos2_session = create_session(token=args.get('giteos2_authtoken'), username=args.get('giteos2_username'), password=args.get('giteos2_password'), verify=args['giteos2_certs'])
+    install_api_rate_limiter(eos2_session, eos2_api_url, args, report)
+    gitEnterpriseLogin(eos2_session, eos2_api_url, args)
+    github_source = {'name': 'github',
+                     'organization': args['github_organization'],
+                     'url': args['github_url'],
+                     'jobs': int(args.get('github_jobs') or args['jobs']),
+                     'pages': iter_org_repository_pages(github_session, github_api_url, args['github_organization'], cache, github_stats)}
     # Eliminate repositories that have already been moved to github
-    eos2_repos = []
-    eos2_source = gitEnterpriseConnect(args)
-    strip_space = len(args['giteos2_organization']) + 1
-    eos2_org = eos2_source.organization(args['giteos2_organization'])
-    for repo in eos2_org.iter_repos(type='all'):
-        repo = str(repo)[strip_space:]
-        if repo not in github_repos:
-            eos2_repos.append(repo)
-    eos2_repos = sorted(eos2_repos)
+    eos2_source = {'name': 'eos2',
+                   'organization': args['giteos2_organization'],
+                   'url': args['giteos2_url'],
+                   'jobs': int(args.get('giteos2_jobs') or args['jobs']),
+                   'defer_to': ['github'],
+                   'pages': iter_org_repository_pages(eos2_session, eos2_api_url, args['giteos2_organization'], cache, eos2_stats)}
 
     print '********************************************************************************'
     print '********************************************************************************'
-    print 'Cloning/Updating github repositories'
+    print 'Cloning/Updating github and eos2 repositories'
     print '********************************************************************************'
     print '********************************************************************************'
-    maven_repos = clone_or_update_repos(repos=github_repos, organization=args['github_organization'], url=args['github_url'], branch=args['git_branch'])
-    print '********************************************************************************'
-    print '********************************************************************************'
-    print 'Cloning/Updating eos2 repositories'
-    print '********************************************************************************'
-    print '********************************************************************************'
-    maven_repos = maven_repos + clone_or_update_repos(repos=eos2_repos, organization=args['giteos2_organization'], url=args['giteos2_url'], branch=args['git_branch'])
-    maven_repos = sorted(maven_repos)
+    clone_options = {'depth': int(args['clone_depth']),
+                     'clone_filter': args.get('clone_filter'),
+                     'single_branch': 'single_branch' in args,
+                     'reference': args.get('clone_reference'),
+                     'fast_update': 'fast_update' in args}
+
+    journal = RunJournal(args['journal_file'], resume='resume' in args)
+    if 'resume' in args:
+        journal.print_resume_summary()
+
+    def sync_repository(source, repo):
+        repo = repo.strip()
+        if journal.succeeded(repo, read_head_sha(repo)):
+            return repo, True, ['Repo {} was synced by the previous run, skipping it'.format(repo)]
+        start = time.time()
+        repo, success, lines = clone_or_update_repo(repo, source['organization'], source['url'], args['git_branch'], timeout=float(args['git_timeout']), retries=int(args['git_retries']),
+                                                    retry_backoff=float(args['git_retry_backoff']), clone_options=clone_options, report=report)
+        journal.record(repo, 'synced' if success else FAILED, read_head_sha(repo) if success else None, time.time() - start)
+        return repo, success, lines
+
+    def find_maven_repos(repos):
+        # One scan of the workspace, shared with multi-repository-dependency.py through the same cache file.
+        repos = set(repos)
+        return [entry['name'] for entry in scan_workspace('./', args['workspace_cache_file']) if entry['has_pom'] and entry['name'] in repos]
+
+    with report.timed('sync_pipeline'):
+        try:
+            sync = run_sync_pipeline([github_source, eos2_source], sync_repository, find_maven_repos, cache=cache, report=report)
+        finally:
+            journal.close()
+    for source, stats in (('github', github_stats), ('eos2', eos2_stats)):
+        print 'Listed {} repositories from {} with {} requests ({} pages unchanged).'.format(len(sync['listed'][source]), source, stats.get('requests', 0), stats.get('not_modified', 0))
+    print_api_usage()
+    if sync['errors']:
+        for error in sync['errors']:
+            print error
+        print 'Github organization            = "{}"'.format(args['github_organization'])
+        print 'Github Enterprise organization = "{}"'.format(args['giteos2_organization'])
+        exit(1)
+    maven_repos = sync['maven_repos']
     print '\n'
     # Remove the repos we know will not build
     for repo in excluded_maven_repos:
@@ -259,12 +394,27 @@ def main():
         except:
             print 'Repo "{}" is not part of the maven parent build configuration'.format(repo)
             pass
-    write_parent_pom(maven_repo_list=maven_repos, root_parent_version=args['root_parent_version'])
+    with report.timed('write_parent_pom'):
+        write_parent_pom(maven_repo_list=maven_repos, root_parent_version=args['root_parent_version'])
+    # Failed repositories only leave out their module, the rest of the run is kept. --resume retries just them.
+    if sync['failed_repos']:
+        print ''
+        print 'Unable to clone/update the following repositories: {}'.format(', '.join(sync['failed_repos']))
+        print 'Run again with --resume to retry only these.'
+        sys.stdout.flush()
+        exit(1)
 
 
 if __name__ == '__main__':
     start_time = time.time()
     start_clock = time.clock()
-    main()
+    args = getArguments()
+    report = RunReport('checkout_all_repos')
+    try:
+        run_profiled(lambda: main(args, report), args.get('profile'))
+    finally:
+        report.print_summary()
+        if 'run_report' in args:
+            report.write(args['run_report'])
     print('--- {} seconds ---').format((time.time() - start_time))
     print('--- {} clock seconds ---').format((time.clock() - start_clock))
@@ -0,0 +1,89 @@
+# SQLite cache of parsed dependency information keyed by (repository, sha, group_id).
+
+import os
+import time
+import sqlite3
+import cPickle as pickle
+
+# Bump whenever the structure returned by read_dependency_info changes so old entries are dropped.
+CACHE_FORMAT_VERSION = 3
+
+
+class DependencyCache(object):
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, shas_per_repository=2):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.shas_per_repository = shas_per_repository
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.text_factory = str
+        self._create_schema()
+
+    def _create_schema(self):
+        cursor = self.connection.cursor()
+        cursor.execute('CREATE TABLE IF NOT EXISTS cache_info (key TEXT PRIMARY KEY, value TEXT)')
+        row = cursor.execute("SELECT value FROM cache_info WHERE key = 'format_version'").fetchone()
+        if row is None or int(row[0]) != CACHE_FORMAT_VERSION:
+            cursor.execute('DROP TABLE IF EXISTS dependency_info')
+            cursor.execute("INSERT OR REPLACE INTO cache_info VALUES ('format_version', ?)", (str(CACHE_FORMAT_VERSION),))
+        cursor.execute('CREATE TABLE IF NOT EXISTS dependency_info ('
+                       ' repository TEXT, sha TEXT, group_id TEXT,'
+                       ' file_signature TEXT, data BLOB, size INTEGER, last_used REAL,'
+                       ' PRIMARY KEY (repository, sha, group_id))')
+        cursor.execute('CREATE INDEX IF NOT EXISTS dependency_info_last_used ON dependency_info (last_used)')
+        self.connection.commit()
+
+    @staticmethod
+    def file_signature(file_name):
+        # The same sha can be regenerated with a different plugin version, so also compare size and mtime.
+        stat_info = os.stat(file_name)
+        return '{}:{}'.format(stat_info.st_size, int(stat_info.st_mtime))
+
+    def get(self, repository, sha, group_id, file_signature):
+        row = self.connection.execute('SELECT file_signature, data FROM dependency_info WHERE repository = ? AND sha = ? AND group_id = ?',
+                                      (repository, sha, group_id)).fetchone()
+        if row is None or row[0] != file_signature:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute('UPDATE dependency_info SET last_used = ? WHERE repository = ? AND sha = ? AND group_id = ?',
+                                (time.time(), repository, sha, group_id))
+        return pickle.loads(str(row[1]))
+
+    def put(self, repository, sha, group_id, file_signature, dependency_info):
+        data = pickle.dumps(dependency_info, pickle.HIGHEST_PROTOCOL)
+        self.connection.execute('INSERT OR REPLACE INTO dependency_info VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (repository, sha, group_id, file_signature, sqlite3.Binary(data), len(data), time.time()))
+        # Only the most recent shas of a repository are worth keeping around.
+        self.connection.execute('DELETE FROM dependency_info WHERE repository = ? AND group_id = ? AND sha NOT IN'
+                                ' (SELECT sha FROM dependency_info WHERE repository = ? AND group_id = ? ORDER BY last_used DESC LIMIT ?)',
+                                (repository, group_id, repository, group_id, self.shas_per_repository))
+
+    def invalidate(self, repository=None):
+        if repository is None:
+            self.connection.execute('DELETE FROM dependency_info')
+        else:
+            self.connection.execute('DELETE FROM dependency_info WHERE repository = ?', (repository,))
+        self.connection.commit()
+
+    def evict(self):
+        # Drop the least recently used entries until the cache fits in max_bytes.
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM dependency_info').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        rows = self.connection.execute('SELECT repository, sha, group_id, size FROM dependency_info ORDER BY last_used').fetchall()
+        for repository, sha, group_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM dependency_info WHERE repository = ? AND sha = ? AND group_id = ?', (repository, sha, group_id))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
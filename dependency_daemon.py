@@ -0,0 +1,151 @@
+# Long running mode: keeps the dependency information in memory, rereads repositories whose HEAD moved
+# and serves /order, /impacted?names=a,b and /status as JSON over HTTP.
+
+import sys
+import json
+import time
+import urlparse
+import threading
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from git_access import GitError, get_head_sha
+
+
+class DependencyGraphDaemon(object):
+
+    def __init__(self, list_repositories, read_repository, compute_build_groups, create_reverse_dependency_index, find_impacted_repositories):
+        # The callables come from multi-repository-dependency.py so both modes share one implementation.
+        #   list_repositories()                    -> repository names
+        #   read_repository(repository)            -> the read_dependency_info dictionary of one repository, or None
+        #   compute_build_groups(info)             -> (groups, remaining, upstream, downstream, missing)
+        #   create_reverse_dependency_index(info)  -> index for find_impacted_repositories
+        self.list_repositories = list_repositories
+        self.read_repository = read_repository
+        self.compute_build_groups = compute_build_groups
+        self.create_reverse_dependency_index = create_reverse_dependency_index
+        self.find_impacted_repositories = find_impacted_repositories
+        self.repository_dependency_info = {}
+        self.shas = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.last_refresh = None
+        self.groups = []
+        self.remaining = []
+        self.reverse_dependency_index = {'artifact_producers': {}, 'downstream': {}}
+
+    def refresh(self):
+        # Returns the repositories that were read again and the ones that went away.
+        repositories = set(self.list_repositories())
+        changed = []
+        for repository in sorted(repositories):
+            try:
+                sha = get_head_sha(repository)
+            except GitError:
+                sha = None
+            if repository not in self.shas or self.shas[repository] != sha:
+                changed.append((repository, sha))
+        removed = [repository for repository in self.repository_dependency_info if repository not in repositories]
+
+        updates = {}
+        for repository, sha in changed:
+            updates[repository] = (sha, self.read_repository(repository))
+        if not updates and not removed:
+            self.last_refresh = time.time()
+            return [], []
+
+        # Everything below works on a copy so queries keep seeing a consistent state.
+        repository_dependency_info = dict(self.repository_dependency_info)
+        shas = dict(self.shas)
+        for repository in removed:
+            repository_dependency_info.pop(repository, None)
+            shas.pop(repository, None)
+        for repository, (sha, dependency_info) in updates.iteritems():
+            shas[repository] = sha
+            if dependency_info is None:
+                repository_dependency_info.pop(repository, None)
+            else:
+                repository_dependency_info[repository] = dependency_info
+        groups, remaining, upstream, downstream, missing = self.compute_build_groups(repository_dependency_info)
+        reverse_dependency_index = self.create_reverse_dependency_index(repository_dependency_info)
+        with self.lock:
+            self.repository_dependency_info = repository_dependency_info
+            self.shas = shas
+            self.groups = groups
+            self.remaining = remaining
+            self.reverse_dependency_index = reverse_dependency_index
+            self.generation += 1
+            self.last_refresh = time.time()
+        return [repository for repository, sha in changed], removed
+
+    def order(self):
+        with self.lock:
+            return {'generation': self.generation, 'groups': self.groups, 'remaining': self.remaining}
+
+    def impacted(self, names):
+        with self.lock:
+            reverse_dependency_index = self.reverse_dependency_index
+            generation = self.generation
+        changed, unknown, groups = self.find_impacted_repositories(reverse_dependency_index, names)
+        return {'generation': generation, 'changed': changed, 'unknown': unknown, 'groups': groups}
+
+    def status(self):
+        with self.lock:
+            return {'generation': self.generation, 'last_refresh': self.last_refresh, 'repositories': len(self.shas), 'shas': self.shas}
+
+    def serve(self, host, port):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse.urlparse(self.path)
+                query = urlparse.parse_qs(url.query)
+                if url.path == '/order':
+                    self.send_json(200, daemon.order())
+                elif url.path == '/impacted':
+                    names = [name for value in query.get('names', []) for name in value.split(',') if name]
+                    self.send_json(200, daemon.impacted(names))
+                elif url.path == '/status':
+                    self.send_json(200, daemon.status())
+                else:
+                    self.send_json(404, {'error': 'unknown path {}'.format(url.path)})
+
+            def send_json(self, code, body):
+                data = json.dumps(body, sort_keys=True)
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        server = Server((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def run(self, host, port, poll_interval):
+        server = self.serve(host, port)
+        print 'Serving the dependency graph on http://{}:{}/ (order, impacted?names=, status)'.format(*server.server_address)
+        sys.stdout.flush()
+        try:
+            while True:
+                start = time.time()
+                changed, removed = self.refresh()
+                if changed or removed:
+                    print '{} generation {}: {} repositories read, {} removed in {:.3f} seconds'.format(
+                        time.strftime('%Y-%m-%d %H:%M:%S'), self.generation, len(changed), len(removed), time.time() - start)
+                    sys.stdout.flush()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
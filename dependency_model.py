@@ -0,0 +1,121 @@
+# Shared, interned Artifact records for the dependency information, see parse_repository_dependency_info.
+
+import sys
+import weakref
+
+FIELDS = ('group_id', 'name', 'type', 'version', 'phase')
+
+# Records that are no longer referenced drop out, so a long running daemon does not keep every version it ever saw.
+_artifacts = weakref.WeakValueDictionary()
+# The same records by their group_id:name:type:version:phase line, which skips splitting and interning lines seen before.
+_artifacts_by_coordinates = weakref.WeakValueDictionary()
+
+
+def intern_string(value):
+    # intern only takes byte strings, ElementTree hands out unicode for non ascii text.
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+class Artifact(object):
+    __slots__ = FIELDS + ('key', '__weakref__')
+
+    def __init__(self, group_id, name, type, version, phase):
+        self.group_id = group_id
+        self.name = name
+        self.type = type
+        self.version = version
+        self.phase = phase
+        # group_id:name:type:version, the key of the dependency dictionaries.
+        self.key = intern_string(group_id + ':' + name + ':' + type + ':' + version)
+
+    def __getitem__(self, field):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        if field not in FIELDS:
+            return default
+        return getattr(self, field)
+
+    def keys(self):
+        return list(FIELDS)
+
+    def fields(self):
+        return (self.group_id, self.name, self.type, self.version, self.phase)
+
+    def to_dict(self):
+        return dict(zip(FIELDS, self.fields()))
+
+    def __eq__(self, other):
+        if not isinstance(other, Artifact):
+            return NotImplemented
+        return self.fields() == other.fields()
+
+    def __ne__(self, other):
+        if not isinstance(other, Artifact):
+            return NotImplemented
+        return self.fields() != other.fields()
+
+    def __hash__(self):
+        return hash(self.fields())
+
+    def __reduce__(self):
+        # Unpickling goes through artifact() so records loaded from the dependency cache are shared too.
+        return artifact, self.fields()
+
+    def __repr__(self):
+        return 'Artifact({})'.format(', '.join(repr(value) for value in self.fields()))
+
+
+def artifact(group_id, name, type, version, phase=''):
+    # The shared record of these coordinates.
+    fields = (intern_string(group_id), intern_string(name), intern_string(type), intern_string(version), intern_string(phase))
+    entry = _artifacts.get(fields)
+    if entry is None:
+        entry = Artifact(*fields)
+        _artifacts[fields] = entry
+    return entry
+
+
+def artifact_from_coordinates(coordinates, parse_artifact):
+    # The shared record of a group_id:name:type:version[:phase] line, parse_artifact splits lines not seen before.
+    entry = _artifacts_by_coordinates.get(coordinates)
+    if entry is None:
+        entry = artifact(*parse_artifact(coordinates))
+        _artifacts_by_coordinates[coordinates] = entry
+    return entry
+
+
+def dependency_tree_edge(depth, parent, child):
+    return (depth, intern_string(parent), intern_string(child))
+
+
+def to_json(value):
+    # default of json.dump for dependency information holding Artifact records.
+    if isinstance(value, Artifact):
+        return value.to_dict()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def deep_size(value):
+    # Bytes taken by value and everything it refers to, every object counted once however often it is shared.
+    seen = set()
+    size = 0
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            pending.extend(value.iterkeys())
+            pending.extend(value.itervalues())
+        elif isinstance(value, (list, tuple, set)):
+            pending.extend(value)
+        elif isinstance(value, Artifact):
+            pending.extend(value.fields() + (value.key,))
+    return size
@@ -0,0 +1,228 @@
+# Indexed binary form of symphony_dependency_order_data.json, read through mmap.
+#
+# Layout (little endian)
+#     header           MAGIC, FORMAT_VERSION and (offset, count) of every section
+#     strings          count + 1 offsets into the blob that follows them, sorted so they can be binary searched
+#     repositories     name, artifact start/count, dependency start/count, edge start/count, sorted by name
+#     artifacts        string of the artifact line
+#     dependencies     repository, kind, group_id, name, type, version, phase
+#     name index       name, start/count in the name permutation
+#     name permutation dependency row numbers ordered by name
+#     edges            repository, depth, parent, child
+
+import mmap
+import struct
+
+from dependency_model import artifact, dependency_tree_edge, intern_string
+from file_utils import atomic_write
+
+MAGIC = 'SDEP'
+FORMAT_VERSION = 1
+SECTIONS = ['strings', 'repositories', 'artifacts', 'dependencies', 'name_index', 'name_permutation', 'edges']
+HEADER = struct.Struct('<4sI' + 'II' * len(SECTIONS))
+UINT = struct.Struct('<I')
+REPOSITORY_ROW = struct.Struct('<IIIIIII')
+DEPENDENCY_ROW = struct.Struct('<IIIIIII')
+NAME_INDEX_ROW = struct.Struct('<III')
+EDGE_ROW = struct.Struct('<IIII')
+
+# Which dictionary of the repository a dependency row came from.
+DEPENDENCY_KINDS = ['group_dependencies', 'other_dependencies', 'group_dependencies_non_versioned']
+ENTRY_FIELDS = ['group_id', 'name', 'type', 'version', 'phase']
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def write_dependency_store(repository_dependency_info, file_name):
+    strings = set()
+    for repository, dependency_info in repository_dependency_info.iteritems():
+        strings.add(_encode(repository))
+        strings.update(_encode(artifact) for artifact in dependency_info['artifacts'])
+        for kind in DEPENDENCY_KINDS:
+            for key, entry in dependency_info[kind].iteritems():
+                strings.update(_encode(entry[field]) for field in ENTRY_FIELDS)
+        for depth, parent, child in dependency_info.get('dependency_tree_edges', []):
+            strings.add(_encode(parent))
+            strings.add(_encode(child))
+    strings = sorted(strings)
+    string_ids = dict((value, number) for number, value in enumerate(strings))
+
+    repository_rows = []
+    artifact_rows = []
+    dependency_rows = []
+    edge_rows = []
+    for repository in sorted(repository_dependency_info, key=_encode):
+        dependency_info = repository_dependency_info[repository]
+        repository_number = len(repository_rows)
+        artifact_start = len(artifact_rows)
+        dependency_start = len(dependency_rows)
+        edge_start = len(edge_rows)
+        artifact_rows.extend(string_ids[_encode(artifact)] for artifact in dependency_info['artifacts'])
+        for kind_number, kind in enumerate(DEPENDENCY_KINDS):
+            for key, entry in sorted(dependency_info[kind].iteritems()):
+                # The dictionary key is always rebuilt from the entry so it does not need its own column.
+                dependency_rows.append((repository_number, kind_number) + tuple(string_ids[_encode(entry[field])] for field in ENTRY_FIELDS))
+        for depth, parent, child in dependency_info.get('dependency_tree_edges', []):
+            edge_rows.append((repository_number, depth, string_ids[_encode(parent)], string_ids[_encode(child)]))
+        repository_rows.append((string_ids[_encode(repository)], artifact_start, len(artifact_rows) - artifact_start,
+                                dependency_start, len(dependency_rows) - dependency_start, edge_start, len(edge_rows) - edge_start))
+
+    name_permutation = sorted(range(len(dependency_rows)), key=lambda row: (dependency_rows[row][3], row))
+    name_index = []
+    for position, row in enumerate(name_permutation):
+        name = dependency_rows[row][3]
+        if name_index and name_index[-1][0] == name:
+            name_index[-1][2] += 1
+        else:
+            name_index.append([name, position, 1])
+
+    sections = {}
+    string_offsets = [0]
+    for value in strings:
+        string_offsets.append(string_offsets[-1] + len(value))
+    sections['strings'] = (struct.pack('<{}I'.format(len(string_offsets)), *string_offsets) + ''.join(strings), len(strings))
+    sections['repositories'] = (''.join(REPOSITORY_ROW.pack(*row) for row in repository_rows), len(repository_rows))
+    sections['artifacts'] = (struct.pack('<{}I'.format(len(artifact_rows)), *artifact_rows), len(artifact_rows))
+    sections['dependencies'] = (''.join(DEPENDENCY_ROW.pack(*row) for row in dependency_rows), len(dependency_rows))
+    sections['name_index'] = (''.join(NAME_INDEX_ROW.pack(*row) for row in name_index), len(name_index))
+    sections['name_permutation'] = (struct.pack('<{}I'.format(len(name_permutation)), *name_permutation), len(name_permutation))
+    sections['edges'] = (''.join(EDGE_ROW.pack(*row) for row in edge_rows), len(edge_rows))
+
+    header_values = []
+    offset = HEADER.size
+    for section in SECTIONS:
+        header_values += [offset, sections[section][1]]
+        # Keep every section 4 byte aligned.
+        offset += (len(sections[section][0]) + 3) & ~3
+    with atomic_write(file_name, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, *header_values))
+        for section in SECTIONS:
+            data = sections[section][0]
+            f.write(data)
+            f.write('\0' * (((len(data) + 3) & ~3) - len(data)))
+
+
+class DependencyStore(object):
+
+    def __init__(self, file_name):
+        self.file = open(file_name, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        values = HEADER.unpack_from(self.data, 0)
+        if values[0] != MAGIC or values[1] != FORMAT_VERSION:
+            raise ValueError('{} is not a version {} dependency store'.format(file_name, FORMAT_VERSION))
+        self.sections = dict((section, (values[2 + 2 * number], values[3 + 2 * number])) for number, section in enumerate(SECTIONS))
+        strings_offset, self.string_count = self.sections['strings']
+        self.string_blob_offset = strings_offset + 4 * (self.string_count + 1)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def string(self, number):
+        start, end = struct.unpack_from('<II', self.data, self.sections['strings'][0] + 4 * number)
+        return self.data[self.string_blob_offset + start:self.string_blob_offset + end]
+
+    def find_string(self, value):
+        # Binary search of the sorted string table. Returns the string number or None.
+        value = _encode(value)
+        low, high = 0, self.string_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.string(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.string_count and self.string(low) == value:
+            return low
+        return None
+
+    def _row(self, section, row_struct, number):
+        return row_struct.unpack_from(self.data, self.sections[section][0] + row_struct.size * number)
+
+    def _uint(self, section, number):
+        return UINT.unpack_from(self.data, self.sections[section][0] + 4 * number)[0]
+
+    def repositories(self):
+        return [self.string(self._row('repositories', REPOSITORY_ROW, number)[0]) for number in range(self.sections['repositories'][1])]
+
+    def _find_repository(self, repository):
+        # Repository rows are sorted by name so they can be searched the same way as the strings.
+        name = self.find_string(repository)
+        low, high = 0, self.sections['repositories'][1]
+        while name is not None and low < high:
+            middle = (low + high) // 2
+            row = self._row('repositories', REPOSITORY_ROW, middle)
+            if row[0] == name:
+                return row
+            if row[0] < name:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _entry(self, row):
+        return artifact(*[self.string(number) for number in row[2:]])
+
+    def dependents_of(self, artifact_name, kind='group_dependencies'):
+        # Sorted repositories with a dependency of the given kind on any version of artifact_name.
+        name = self.find_string(artifact_name)
+        if name is None:
+            return []
+        kind_number = DEPENDENCY_KINDS.index(kind)
+        low, high = 0, self.sections['name_index'][1]
+        while low < high:
+            middle = (low + high) // 2
+            index_name, start, count = self._row('name_index', NAME_INDEX_ROW, middle)
+            if index_name == name:
+                repositories = set()
+                for position in range(start, start + count):
+                    row = self._row('dependencies', DEPENDENCY_ROW, self._uint('name_permutation', position))
+                    if row[1] == kind_number:
+                        repositories.add(self.string(self._row('repositories', REPOSITORY_ROW, row[0])[0]))
+                return sorted(repositories)
+            if index_name < name:
+                low = middle + 1
+            else:
+                high = middle
+        return []
+
+    def repository_info(self, repository):
+        # The dictionary read_dependency_info builds for the repository, or None when it is unknown.
+        row = self._find_repository(repository)
+        if row is None:
+            return None
+        return self._repository_info(row)
+
+    def _repository_info(self, row):
+        name, artifact_start, artifact_count, dependency_start, dependency_count, edge_start, edge_count = row
+        dependency_info = {'artifacts': [intern_string(self.string(self._uint('artifacts', number))) for number in range(artifact_start, artifact_start + artifact_count)]}
+        if self.sections['edges'][1]:
+            # Written with --dependency_tree_edges.
+            dependency_info['dependency_tree_edges'] = []
+        for kind in DEPENDENCY_KINDS:
+            dependency_info[kind] = {}
+        for number in range(dependency_start, dependency_start + dependency_count):
+            dependency_row = self._row('dependencies', DEPENDENCY_ROW, number)
+            entry = self._entry(dependency_row)
+            kind = DEPENDENCY_KINDS[dependency_row[1]]
+            if kind == 'group_dependencies_non_versioned':
+                key = entry.group_id + ':' + entry.name
+            else:
+                key = entry.key
+            dependency_info[kind][intern_string(key)] = entry
+        for number in range(edge_start, edge_start + edge_count):
+            repository_number, depth, parent, child = self._row('edges', EDGE_ROW, number)
+            dependency_info['dependency_tree_edges'].append(dependency_tree_edge(depth, self.string(parent), self.string(child)))
+        return dependency_info
+
+    def to_dict(self):
+        # Everything, in the same structure that is written to the JSON file.
+        repository_dependency_info = {}
+        for number in range(self.sections['repositories'][1]):
+            row = self._row('repositories', REPOSITORY_ROW, number)
+            repository_dependency_info[self.string(row[0])] = self._repository_info(row)
+        return repository_dependency_info
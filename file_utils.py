@@ -0,0 +1,19 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(file_name, mode='w'):
+    # Write to <file_name>.tmp and only replace file_name once that is complete.
+    # The old file is removed first because os.rename does not replace an existing file on Windows.
+    temp_file_name = file_name + '.tmp'
+    try:
+        with open(temp_file_name, mode) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+        raise
+    if os.path.exists(file_name):
+        os.remove(file_name)
+    os.rename(temp_file_name, file_name)
@@ -0,0 +1,133 @@
+# Read only git queries. HEAD and config values are read from the files under .git, falling back to git itself.
+
+import os
+import re
+import subprocess
+
+SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+CONFIG_SECTION_PATTERN = re.compile(r'^\[\s*([^\s"\]]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+
+
+class GitError(Exception):
+    pass
+
+
+def run_git(args, cwd=None):
+    # Run git without a shell. Returns (return code, standard output, standard error)
+    p = subprocess.Popen(['git'] + list(args), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, err) = p.communicate()
+    return p.returncode, output, err
+
+
+def find_git_dirs(repository):
+    # Returns (git dir, common dir). They only differ for linked worktrees.
+    git_dir = os.path.join(repository, '.git')
+    if os.path.isfile(git_dir):
+        # Worktrees and submodules use a .git file pointing at the real directory.
+        with open(git_dir, 'r') as f:
+            content = f.read().strip()
+        if not content.startswith('gitdir:'):
+            return None, None
+        git_dir = os.path.normpath(os.path.join(repository, content[len('gitdir:'):].strip()))
+    if not os.path.isdir(git_dir):
+        return None, None
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, 'r') as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir, common_dir
+
+
+def read_ref(git_dir, common_dir, ref):
+    for directory in (git_dir, common_dir):
+        ref_file = os.path.join(directory, ref)
+        if os.path.isfile(ref_file):
+            with open(ref_file, 'r') as f:
+                value = f.read().strip()
+            if value.startswith('ref:'):
+                return read_ref(git_dir, common_dir, value[len('ref:'):].strip())
+            return value if SHA_PATTERN.match(value) else None
+    packed_refs_file = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_refs_file):
+        with open(packed_refs_file, 'r') as f:
+            for line in f:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    return None
+
+
+def read_head_sha(repository):
+    # Returns the sha of HEAD from the files under .git or None when it can not be determined that way.
+    git_dir, common_dir = find_git_dirs(repository)
+    if git_dir is None:
+        return None
+    return read_ref(git_dir, common_dir, 'HEAD')
+
+
+def read_config_value(repository, name):
+    # Returns the value of a single valued key like remote.origin.url, '' when it is not set
+    # or None when the config file has to be left to git (include directives).
+    git_dir, common_dir = find_git_dirs(repository)
+    if git_dir is None:
+        return None
+    section_name, _, key = name.rpartition('.')
+    section, _, subsection = section_name.partition('.')
+    value = ''
+    current_section = None
+    current_subsection = None
+    try:
+        with open(os.path.join(common_dir, 'config'), 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line[0] in '#;':
+                    continue
+                if line.startswith('['):
+                    match = CONFIG_SECTION_PATTERN.match(line)
+                    if not match:
+                        return None
+                    current_section = match.group(1).lower()
+                    current_subsection = match.group(2)
+                    if current_section in ('include', 'includeif'):
+                        return None
+                    continue
+                if current_section != section.lower() or (current_subsection or '') != subsection:
+                    continue
+                config_key, _, config_value = line.partition('=')
+                if config_key.strip().lower() == key.lower():
+                    config_value = config_value.strip()
+                    if config_value.startswith('"') or '\\' in config_value or '#' in config_value or ';' in config_value:
+                        # Quoting, escapes and trailing comments are left to git.
+                        return None
+                    value = config_value
+    except IOError:
+        return None
+    return value
+
+
+def get_head_sha(repository='.'):
+    sha = read_head_sha(repository)
+    if sha is None:
+        returncode, output, err = run_git(['rev-parse', 'HEAD'], cwd=repository)
+        if returncode != 0:
+            raise GitError('Unable to read HEAD of {}: {}'.format(repository, err.strip()))
+        sha = output.strip()
+    return sha
+
+
+def get_config_value(repository, name):
+    value = read_config_value(repository, name)
+    if value is None:
+        returncode, output, err = run_git(['config', '--get', name], cwd=repository)
+        # git config exits with 1 when the key is not set
+        if returncode not in (0, 1):
+            raise GitError('Unable to read {} of {}: {}'.format(name, repository, err.strip()))
+        value = output.strip()
+    return value
+
+
+def get_remote_url(repository='.', remote='origin'):
+    return get_config_value(repository, 'remote.{}.url'.format(remote))
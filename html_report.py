@@ -0,0 +1,214 @@
+# Renders the html pages of multi-repository-dependency.py from templates.
+
+import os
+import re
+import cgi
+import json
+from glob import glob
+from string import Template
+
+from build_schedule import format_duration
+from file_utils import atomic_write
+
+HEADER = Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="ISO-8859-1">
+<title>${title}</title>
+<link rel="shortcut icon" href="table.png"><style>
+tr:nth-of-type(odd) {
+background-color: lightgreen;
+}
+tr:nth-of-type(even) {
+  background-color: #A3FF4B;
+}
+  .build_order_width {
+    width: 110px;
+  }
+  .build_job_width {
+    width: 320px;
+  }
+</style>
+</head>
+<body>
+<h2 align="center">${title}</h2>
+''')
+
+FOOTER = Template('''  <br>
+  <br>
+  <h4>Report created on ${generated}</h4>
+</body>
+</html>
+''')
+
+# Hides the rows of the page whose data-repository does not contain the search text.
+SEARCH = '''  <input type="search" placeholder="Filter repositories" oninput="filterRows(this.value)" style="width: 320px;">
+  <script>
+  function filterRows(text) {
+    text = text.toLowerCase();
+    var rows = document.querySelectorAll('tr[data-repository]');
+    for (var i = 0; i < rows.length; i++) {
+      rows[i].style.display = rows[i].getAttribute('data-repository').indexOf(text) < 0 ? 'none' : '';
+    }
+  }
+  </script>
+'''
+
+# Search over [repository, group, page file] of all pages, for the first page of a split report.
+INDEX_SEARCH = Template('''  <input type="search" placeholder="Find a repository" oninput="findRepository(this.value)" style="width: 320px;">
+  <ul id="found"></ul>
+  <script>
+  var repositoryIndex = ${index};
+  function findRepository(text) {
+    text = text.toLowerCase();
+    var found = document.getElementById('found');
+    var items = [];
+    for (var i = 0; text && i < repositoryIndex.length && items.length < 50; i++) {
+      var entry = repositoryIndex[i];
+      if (entry[0].toLowerCase().indexOf(text) >= 0) {
+        items.push('<li><a href="' + entry[2] + '#' + entry[0] + '">' + entry[0] + '</a> build group ' + entry[1] + '</li>');
+      }
+    }
+    found.innerHTML = items.join('');
+  }
+  </script>
+''')
+
+GROUP_ROW = Template('''      <tr style="color: black; background: lightgray;">
+        <td>Build Group ${group_num}</td>      </tr>
+      <tr>
+''')
+
+REPOSITORY_ROW = Template('''        <tr id="${repository}" data-repository="${search_key}">
+        <td><a href="${git_url}">${repository}</a></td>
+        <td><a href="${pipeline_build}">pipeline build</a></td>
+${schedule}        </tr>
+''')
+
+SCHEDULE_CELLS = Template('''        <td>build ${duration}${estimated}</td>
+        <td>start ${earliest_start} - ${latest_start}</td>
+${slack}''')
+
+PAGE_LINK = Template('''    <li><a href="${page}">Build Group ${first_group} - ${last_group}</a> ${repositories} repositories</li>
+''')
+
+
+def escape(value):
+    return cgi.escape(value or '', True)
+
+
+def render_header(title):
+    return HEADER.substitute(title=escape(title))
+
+
+def render_footer(generated):
+    return FOOTER.substitute(generated=escape(generated))
+
+
+def write_html_file(html_file_name, parts):
+    # One write of the rendered page to a temporary file that then replaces the page.
+    with atomic_write(html_file_name) as html_file:
+        html_file.write(''.join(parts))
+
+
+def get_pipeline_build_url(repository, git_url):
+    organization = git_url.split('/')[3] if git_url.count('/') >= 3 else ''
+    if organization == 'VCE-Symphony':
+        return 'http://ci-build.mpe.lab.vce.com:8080/job/vce-symphony/job/{}'.format(repository)
+    for pattern, job in (('^[a-c].*', 'dellemc-symphony1'), ('^[d-h].*', 'dellemc-symphony2'), ('^[i-q].*', 'dellemc-symphony3'),
+                         ('^[r].*', 'dellemc-symphony4'), ('^[s-z].*', 'dellemc-symphony5')):
+        if re.match(pattern, repository):
+            return 'http://ci-build.mpe.lab.vce.com:8080/job/{}/job/{}'.format(job, repository)
+    return ''
+
+
+def render_build_schedule_summary(build_schedule):
+    parts = ['  <h3>Estimated makespan {} ({} of build time)</h3>\n'.format(
+        format_duration(build_schedule['makespan']), format_duration(build_schedule['total_build_seconds']))]
+    if build_schedule['estimated_repositories']:
+        parts.append('  <p>{} repositories have no recorded build time and count as {}.</p>\n'.format(
+            len(build_schedule['estimated_repositories']), format_duration(build_schedule['default_duration'])))
+    parts.append('  <h4>Speed up first (critical path, longest build first)</h4>\n')
+    parts.append('  <ol>\n')
+    for repository in build_schedule['speed_up_first']:
+        parts.append('    <li>{} {}</li>\n'.format(escape(repository), format_duration(build_schedule['repositories'][repository]['duration'])))
+    parts.append('  </ol>\n')
+    return parts
+
+
+def render_repository_row(repository, repository_urls, build_schedule):
+    sha, git_url = repository_urls.get(repository, ('', ''))
+    schedule = ''
+    if build_schedule is not None and repository in build_schedule['repositories']:
+        repository_schedule = build_schedule['repositories'][repository]
+        if repository_schedule['critical']:
+            slack = '        <td style="color: red;"><b>critical</b></td>\n'
+        else:
+            slack = '        <td>slack {}</td>\n'.format(format_duration(repository_schedule['slack']))
+        schedule = SCHEDULE_CELLS.substitute(duration=format_duration(repository_schedule['duration']),
+                                             estimated=' (estimated)' if repository_schedule['estimated'] else '',
+                                             earliest_start=format_duration(repository_schedule['earliest_start']),
+                                             latest_start=format_duration(repository_schedule['latest_start']), slack=slack)
+    return REPOSITORY_ROW.substitute(repository=escape(repository), search_key=escape(repository.lower()), git_url=escape(git_url),
+                                     pipeline_build=escape(get_pipeline_build_url(repository, git_url)), schedule=schedule)
+
+
+def render_groups(numbered_groups, repository_urls, build_schedule):
+    parts = ['  <table border=1>\n', '    <tbody>\n']
+    for group_num, group in numbered_groups:
+        parts.append(GROUP_ROW.substitute(group_num=group_num))
+        for repository in group:
+            parts.append(render_repository_row(repository, repository_urls, build_schedule))
+        parts.append('      </tr>\n')
+    parts.append('    </tbody>\n')
+    parts.append('  </table>\n')
+    return parts
+
+
+def split_pages(groups, page_size):
+    # Pages of whole groups with about page_size repositories each, [[(group_num, group)]].
+    pages = [[]]
+    count = 0
+    for group_num, group in enumerate(groups):
+        if pages[-1] and count + len(group) > page_size:
+            pages.append([])
+            count = 0
+        pages[-1].append((group_num, group))
+        count += len(group)
+    return pages
+
+
+def write_build_order_report(groups, repository_urls, generated, html_file_name='symphony_build_order.html', title='Symphony Build Order',
+                             build_schedule=None, page_size=0):
+    # groups are the build groups, repository_urls {repository: (sha, remote url)}.
+    # With a page_size below the number of repositories the groups are split over
+    # <name>_<page>.html and html_file_name becomes the index of those pages.
+    base_name = os.path.splitext(html_file_name)[0]
+    page_files = []
+    header = [render_header(title)]
+    if build_schedule is not None:
+        header += render_build_schedule_summary(build_schedule)
+    if not page_size or sum(len(group) for group in groups) <= page_size:
+        write_html_file(html_file_name, header + [SEARCH] + render_groups(list(enumerate(groups)), repository_urls, build_schedule) + [render_footer(generated)])
+    else:
+        pages = split_pages(groups, page_size)
+        index = []
+        links = []
+        for page_num, page in enumerate(pages):
+            page_file = '{}_{}.html'.format(base_name, page_num + 1)
+            page_files.append(page_file)
+            page_title = '{} page {} of {}'.format(title, page_num + 1, len(pages))
+            navigation = '  <p><a href="{}">index</a></p>\n'.format(escape(os.path.basename(html_file_name)))
+            write_html_file(page_file, [render_header(page_title), navigation, SEARCH] + render_groups(page, repository_urls, build_schedule) + [render_footer(generated)])
+            for group_num, group in page:
+                index.extend([repository, group_num, os.path.basename(page_file)] for repository in group)
+            links.append(PAGE_LINK.substitute(page=escape(os.path.basename(page_file)), first_group=page[0][0], last_group=page[-1][0],
+                                              repositories=sum(len(group) for group_num, group in page)))
+        # </ would end the script element early.
+        index_json = json.dumps(index).replace('</', '<\\/')
+        write_html_file(html_file_name, header + [INDEX_SEARCH.substitute(index=index_json), '  <ul>\n'] + links + ['  </ul>\n', render_footer(generated)])
+    # Pages of an earlier, longer report would otherwise be left behind.
+    for stale_page in glob('{}_*.html'.format(base_name)):
+        if stale_page not in page_files and re.match(r'_\d+\.html$', stale_page[len(base_name):]):
+            os.remove(stale_page)
+    return [html_file_name] + page_files
@@ -12,14 +12,35 @@ import json
 import stat
 import time
 import shutil
+import shlex
 import argparse
 import platform
 import subprocess
-from glob import glob
+from multiprocessing import Pool
+from dependency_cache import DependencyCache
+from dependency_model import artifact_from_coordinates, dependency_tree_edge, intern_string, to_json
+from file_utils import atomic_write
+from git_access import GitError, get_head_sha, get_remote_url, read_head_sha
+from run_journal import RunJournal
+from run_report import RunReport, run_profiled
+from pom_dependencies import PomError, read_repository_pom_info, read_repository_poms
+from dependency_store import DependencyStore, write_dependency_store
+from dependency_daemon import DependencyGraphDaemon
+from build_executor import FAILED, execute_builds, print_build_summary
+from version_drift import analyze_version_drift
+from workspace_scanner import scan_workspace
+from html_report import escape, render_footer, render_header, write_build_order_report, write_html_file
+from build_schedule import compute_build_schedule, print_build_schedule, read_build_timings, update_build_timings, write_build_schedule
 from chainmap import  ChainMap
 from StringIO import StringIO
 from ConfigParser import ConfigParser
 
+# The scandir backport avoids a stat call per directory entry. Fall back to listdir when it isn't installed.
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
 debug = False
 
 # This utility script will not work without the following utilities available from the command line.
@@ -49,6 +70,17 @@ debug = False
 FILE_TIMESTAMP_FORMAT = '%Y-%m-%d_%H_%M_%S'
 REPORT_GENERATED_TIME=time.strftime(FILE_TIMESTAMP_FORMAT)
 
+# One line of mvn dependency:tree output. Group 1 is the tree drawing ("+- ", "|  ", "\- ", "   "),
+# three characters per level, and group 2 is the artifact coordinates.
+DEPENDENCY_TREE_LINE = re.compile(r'^([|+\\\- ]*)(\S+)')
+
+# Directories that never hold a maven module but can hold a lot of files.
+SKIPPED_DIRECTORIES = frozenset(['target', 'node_modules', 'src'])
+COPY_BUFFER_SIZE = 1024 * 1024
+# Written by --output_format binary or both, read back by --impacted_by.
+DEPENDENCY_DATA_FILE = 'symphony_dependency_order_data.json'
+DEPENDENCY_STORE_FILE = 'symphony_dependency_order_data.sdep'
+
 def getArguments():
     # Program Internal settings
     # I know that it is slower to load this way but it is more explicit and readable in my opinion
@@ -57,6 +89,26 @@ def getArguments():
     program_defaults['group_id'] = 'com.dell.cpsd'
     program_defaults['maven_dependency_plugin_version'] = '3.0.2'
     program_defaults['dependency_tree_output_file'] = 'dependency_tree'
+    program_defaults['jobs'] = '1'
+    program_defaults['maven_command'] = 'mvn'
+    program_defaults['maven_mode'] = 'repository'
+    program_defaults['dependency_source'] = 'pom'
+    program_defaults['output_format'] = 'json'
+    program_defaults['reverse_dependency_index_file'] = 'symphony_reverse_dependency_index.json'
+    program_defaults['daemon_host'] = '127.0.0.1'
+    program_defaults['daemon_port'] = '8765'
+    program_defaults['poll_interval'] = '5'
+    program_defaults['build_command'] = 'mvn install'
+    program_defaults['build_jobs'] = '4'
+    program_defaults['build_log_dir'] = 'build_logs'
+    program_defaults['build_timings_file'] = 'build_timings.json'
+    program_defaults['build_schedule_file'] = 'symphony_build_schedule.json'
+    program_defaults['html_page_size'] = '0'
+    program_defaults['version_drift_file'] = 'symphony_version_drift.json'
+    program_defaults['workspace_cache_file'] = '.workspace_scan_cache.json'
+    program_defaults['journal_file'] = '.dependency_journal.jsonl'
+    program_defaults['dependency_cache_file'] = '.dependency_cache.sqlite'
+    program_defaults['dependency_cache_max_mb'] = '256'
 
     # Property File settings
     property_file_name = os.path.splitext(os.path.basename(__file__))[0] + '.props'
@@ -78,6 +130,37 @@ def getArguments():
     parser.add_argument('-gid',  '--group_id',                        help='Ibid. Defaults to com.dell.cpsd')
     parser.add_argument('-mpv',  '--maven_dependency_plugin_version', help='Ibid. Defaults to 3.0.2')
     parser.add_argument('-dtof', '--dependency_tree_output_file',     help='Ibid. Defaults to dependency_tree')
+    parser.add_argument('-j',    '--jobs',                            help='Number of maven dependency tree runs at the same time. Defaults to 1')
+    parser.add_argument('-mc',   '--maven_command',                   help='Maven executable, mvnd keeps a warm maven daemon between repositories. Defaults to mvn')
+    parser.add_argument('-mm',   '--maven_mode',                      help='repository runs maven in every changed repository, reactor runs it once over all of them. Defaults to repository', choices=['repository', 'reactor'])
+    parser.add_argument('-dcf',  '--dependency_cache_file',           help='Cache of parsed dependency files. Defaults to .dependency_cache.sqlite')
+    parser.add_argument('-dcm',  '--dependency_cache_max_mb',         help='Size the dependency cache is trimmed to. Defaults to 256')
+    parser.add_argument('-wcf',  '--workspace_cache_file',            help='Cache of the pom, HEAD and remote of every repository directory. Defaults to .workspace_scan_cache.json')
+    parser.add_argument('-r',    '--resume',                          help='Skip repositories whose dependency file the previous run finished at the same sha, retry the rest.', action='store_true')
+    parser.add_argument('-jf',   '--journal_file',                    help='Per repository progress of the dependency file updates, read back by --resume. Defaults to .dependency_journal.jsonl')
+    parser.add_argument('-nc',   '--no_cache',                        help='Parse every dependency file without using the cache.', action='store_true')
+    parser.add_argument('-dte',  '--dependency_tree_edges',           help='Also keep the depth, parent and child of every dependency tree edge in the dependency data files.', action='store_true')
+    parser.add_argument('-ds',   '--dependency_source',               help='pom reads the pom.xml files directly, maven runs mvn dependency:tree in every changed repository. Defaults to pom', choices=['pom', 'maven'])
+    parser.add_argument('-of',   '--output_format',                   help='Format of the dependency data file. binary writes the indexed symphony_dependency_order_data.sdep. Defaults to json', choices=['json', 'binary', 'both'])
+    parser.add_argument('-ib',   '--impacted_by',                     help='Comma separated repositories or artifact names. Prints the repositories to rebuild, in build order, using the index of the last full run. Artifacts no repository produces, like third party ones, are looked up in the dependency data file of the last run.')
+    parser.add_argument('-io',   '--impacted_output',                 help='Also write the --impacted_by result to this JSON file.')
+    parser.add_argument('-rdi',  '--reverse_dependency_index_file',   help='Ibid. Defaults to symphony_reverse_dependency_index.json')
+    parser.add_argument('-d',    '--daemon',                          help='Keep running, re-read repositories whose HEAD moves and serve the build order over HTTP.', action='store_true')
+    parser.add_argument('-dh',   '--daemon_host',                     help='Ibid. Defaults to 127.0.0.1')
+    parser.add_argument('-dp',   '--daemon_port',                     help='Ibid. Defaults to 8765')
+    parser.add_argument('-pi',   '--poll_interval',                   help='Seconds between checks of the repository HEADs in daemon mode. Defaults to 5')
+    parser.add_argument('-b',    '--build',                           help='Build every repository in dependency order once the build order is known.', action='store_true')
+    parser.add_argument('-bc',   '--build_command',                   help='Ibid. Defaults to mvn install')
+    parser.add_argument('-bj',   '--build_jobs',                      help='Number of repositories built at the same time. Defaults to 4')
+    parser.add_argument('-bkg',  '--build_keep_going',                help='Keep building repositories that do not depend on a failed one.', action='store_true')
+    parser.add_argument('-bld',  '--build_log_dir',                   help='Ibid. Defaults to build_logs')
+    parser.add_argument('-btf',  '--build_timings_file',              help='Recorded build seconds per repository used to weight the build order, updated by --build. Defaults to build_timings.json')
+    parser.add_argument('-bsf',  '--build_schedule_file',             help='Ibid. Defaults to symphony_build_schedule.json')
+    parser.add_argument('-hps',  '--html_page_size',                  help='Split the build order page into pages of about this many repositories, 0 keeps one page. Defaults to 0')
+    parser.add_argument('-vd',   '--version_drift',                   help='Report artifacts consumed in more than one version and the repositories using stale versions.', action='store_true')
+    parser.add_argument('-vdf',  '--version_drift_file',              help='Ibid. Defaults to symphony_version_drift.json, the html page is written next to it')
+    parser.add_argument('-rr',   '--run_report',                      help='Write per stage and per repository timings to this file. A .csv name writes CSV, anything else JSON.')
+    parser.add_argument('-prof', '--profile',                         help='Write a cProfile dump of the run to this file.')
     namespace = parser.parse_args()
     # Create a dictionary of the given parser command line inputs
     command_line_args = {k:v for k,v in vars(namespace).items() if v}
@@ -91,16 +174,48 @@ def help():
     print '-mpv or  --maven_dependency_plugin_version   Defaults to 3.0.2'
     print '-gid or  --group_id                          Defaults to com.dell.cpsd'
     print '-dtof or --dependency_tree_output_file       Defaults to dependency_tree'
+    print '-j or    --jobs                              Defaults to 1'
+    print '-mc or   --maven_command                     Defaults to mvn'
+    print '-mm or   --maven_mode                        Defaults to repository (repository or reactor)'
+    print '-dcf or  --dependency_cache_file             Defaults to .dependency_cache.sqlite'
+    print '-dcm or  --dependency_cache_max_mb           Defaults to 256'
+    print '-wcf or  --workspace_cache_file              Defaults to .workspace_scan_cache.json'
+    print '-r or    --resume                            Defaults to False'
+    print '-jf or   --journal_file                      Defaults to .dependency_journal.jsonl'
+    print '-nc or   --no_cache                          Defaults to False'
+    print '-dte or  --dependency_tree_edges             Defaults to False'
+    print '-ds or   --dependency_source                 Defaults to pom (pom or maven)'
+    print '-of or   --output_format                     Defaults to json (json, binary or both)'
+    print '-ib or   --impacted_by                       No default, runs the full build order. Third party artifacts are looked up in the dependency data file'
+    print '-io or   --impacted_output                   No default, the impacted repositories are only printed'
+    print '-rdi or  --reverse_dependency_index_file     Defaults to symphony_reverse_dependency_index.json'
+    print '-d or    --daemon                            Defaults to False'
+    print '-dh or   --daemon_host                       Defaults to 127.0.0.1'
+    print '-dp or   --daemon_port                       Defaults to 8765'
+    print '-pi or   --poll_interval                     Defaults to 5'
+    print '-b or    --build                             Defaults to False'
+    print '-bc or   --build_command                     Defaults to mvn install'
+    print '-bj or   --build_jobs                        Defaults to 4'
+    print '-bkg or  --build_keep_going                  Defaults to False, stop starting builds after the first failure'
+    print '-bld or  --build_log_dir                     Defaults to build_logs'
+    print '-btf or  --build_timings_file                Defaults to build_timings.json'
+    print '-bsf or  --build_schedule_file               Defaults to symphony_build_schedule.json'
+    print '-hps or  --html_page_size                    Defaults to 0, one page'
+    print '-vd or   --version_drift                     Defaults to False'
+    print '-vdf or  --version_drift_file                Defaults to symphony_version_drift.json'
+    print '-rr or   --run_report                        No default, no report is written'
+    print '-prof or --profile                           No default, no profile is written'
     print ''
 
 
 # Add a parameter to choose if we should exit immediately on error.
 # Default is we should exit if the parameter is not supplied.
-def runExternalCommand(cmd, survive_error=False):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
+# The command is an argument list. A shell is only used on Windows where mvn is a batch file.
+def runExternalCommand(cmd, survive_error=False, cwd=None):
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=(platform.system() == 'Windows'), cwd=cwd)
     (output, err) = p.communicate()
     if p.returncode != 0:
-        print 'Error running command "{}"'.format(cmd)
+        print 'Error running command "{}"'.format(' '.join(cmd))
         if output:
             print 'Standard output'
             lines = output.split('\n')
@@ -116,106 +231,277 @@ def runExternalCommand(cmd, survive_error=False):
             sys.stdout.flush()
         if not survive_error:
             exit(p.returncode)
+        return (None, err)
     return (output, err)
 
-def get_current_branch_head():
-    (output, err) = runExternalCommand('git rev-parse HEAD')
-    return output.strip()
-
-def get_current_remote_url():
-    (output, err) = runExternalCommand('git config --get remote.origin.url')
-    return output.strip()
-
-def get_maven_dirs(path):
-    striped_directories=[]
-    directories = glob(path + '*/')
-    for directory in directories:
-        # Strip all extraneous characters so we get only the directory names
-        # Having an issue putting all of the regular expression matches in a single string.
-        # Break them out for clarity as well as get around error
-        directory = re.sub('\.', '', directory, count=1)
-        directory = re.sub('\\\\', '', directory)
-        directory = re.sub('/', '', directory)
-        pom_file_path = directory + os.sep + 'pom.xml'
-        if os.path.exists(pom_file_path):
-            striped_directories.append(directory)
-    return striped_directories
+def get_current_branch_head(cwd=None):
+    try:
+        return get_head_sha(cwd or '.')
+    except GitError as e:
+        print e
+        exit(1)
+
+def get_current_remote_url(cwd=None):
+    try:
+        return get_remote_url(cwd or '.')
+    except GitError as e:
+        print e
+        exit(1)
+
+def get_maven_dirs(path, cache_file=None):
+    return [os.path.normpath(os.path.join(path, entry['name'])) for entry in scan_workspace(path, cache_file) if entry['has_pom']]
+
+def list_directory(directory):
+    # Returns (sub directory names, file names) without following symbolic links.
+    dirs = []
+    files = []
+    if scandir is not None:
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                dirs.append(name)
+            else:
+                files.append(name)
+    return dirs, files
 
 def get_all_files_named(matching_text, start_dir='.'):
+    # Maven writes -DoutputFile relative to each module directory, so hidden directories (.git) and
+    # directories that can not hold a module (target, node_modules, src) are never searched.
     matching_files = []
-    for root, dirs, files in os.walk(start_dir):
-        for file in files:
-            if file == matching_text:
-                matching_files.append(os.path.join(root, file))
+    pending = [start_dir]
+    while pending:
+        directory = pending.pop()
+        try:
+            dirs, files = list_directory(directory)
+        except OSError:
+            continue
+        if matching_text in files:
+            matching_files.append(os.path.join(directory, matching_text))
+        for name in sorted(dirs, reverse=True):
+            if not name.startswith('.') and name not in SKIPPED_DIRECTORIES:
+                pending.append(os.path.join(directory, name))
     return matching_files
 
-def create_update_dependency_files(repositories, maven_dependency_plugin_version, dependency_tree_output):
-    for repository in repositories:
-        if debug:
-            print ''
-            print 'Working with repository {}'.format(repository)
-            sys.stdout.flush()
-        sha = ''
-        old_sha = ''
-        temp_repository_dependency_tree_file= ''
-        repository_dependency_tree_file_name = repository + '.{}'.format(dependency_tree_output)
-        temp_repository_dependency_tree_file_name = repository + '.{}.tmp'.format(dependency_tree_output)
-        # Attempt to open the previous dependency file to compare sha values
-        try:
-            with open(repository_dependency_tree_file_name, 'r') as f:
-                old_sha = f.readline().strip()
-        except IOError:
-            # Skip the error if the file isn't found.
-            print 'No previous {} file exists. A new one will be created.'.format(repository_dependency_tree_file_name)
-            sys.stdout.flush()
+def check_repository_dependency_file(repository, dependency_tree_output, report=None):
+    # Returns ('skipped' or 'stale', sha, remote url) or ('failed', None, None) when git can not be read.
+    report = report or RunReport()
+    old_sha = ''
+    repository_dependency_tree_file_name = repository + '.{}'.format(dependency_tree_output)
+    # Attempt to open the previous dependency file to compare sha values
+    try:
+        with open(repository_dependency_tree_file_name, 'r') as f:
+            old_sha = f.readline().strip()
+    except IOError:
+        # Skip the error if the file isn't found.
+        print 'No previous {} file exists. A new one will be created.'.format(repository_dependency_tree_file_name)
+        sys.stdout.flush()
 
-        if os.path.isfile(temp_repository_dependency_tree_file_name):
-            print 'Removing previously temp file {} '.format(temp_repository_dependency_tree_file_name)
+    try:
+        with report.timed('sha_lookup', repository):
+            sha = get_head_sha(repository)
+            remote_url = get_remote_url(repository)
+    except GitError as e:
+        print e
+        sys.stdout.flush()
+        return 'failed', None, None
+    if old_sha:
+        if sha == old_sha:
+            print 'Current sha is the same as {} file. No need to update the file.'.format(repository_dependency_tree_file_name)
             sys.stdout.flush()
-            os.remove(temp_repository_dependency_tree_file_name)
-
-        with open(temp_repository_dependency_tree_file_name, 'w') as temp_repository_dependency_tree_file:
-            # Go ahead and change into the repository directory.
-            os.chdir(repository)
-            # Grab the sha now once we are in the repository directory
-            sha = get_current_branch_head()
-            # Grab the remote url now that we are in the repository directory
-            remote_url = get_current_remote_url()
-            if old_sha:
-                if sha == old_sha:
-                    print 'Current sha is the same as {} file. No need to update the file.'.format( repository_dependency_tree_file_name)
-                    sys.stdout.flush()
-                    # Get us back to the top level directory
-                    os.chdir('..')
-                    temp_repository_dependency_tree_file.close()
-                    os.remove(temp_repository_dependency_tree_file_name)
-                    continue
-                else:
-                    print 'Current sha is different from {} file. The file will be updated.'.format(repository_dependency_tree_file_name)
-                    sys.stdout.flush()
-            # Write the sha as the first line of the dependency file.
-            temp_repository_dependency_tree_file.write(sha + '\n')
-            # Write the remote url as the second line of the dependency file.
-            temp_repository_dependency_tree_file.write(remote_url + '\n')
-
-            cmd = 'mvn org.apache.maven.plugins:maven-dependency-plugin:{}:tree -DoutputFile={}'.format(maven_dependency_plugin_version, dependency_tree_output)
-            print 'Running command "{}"'.format(cmd)
+            return 'skipped', sha, remote_url
+        else:
+            print 'Current sha is different from {} file. The file will be updated.'.format(repository_dependency_tree_file_name)
             sys.stdout.flush()
-            (output, err) = runExternalCommand(cmd)
+    return 'stale', sha, remote_url
+
+def write_repository_dependency_file(repository, sha, remote_url, dependency_tree_output, report=None):
+    # Combine the dependency tree files maven wrote in the modules of the repository into <repository>.<dependency_tree_output>.
+    report = report or RunReport()
+    repository_dependency_tree_file_name = repository + '.{}'.format(dependency_tree_output)
+    with atomic_write(repository_dependency_tree_file_name) as repository_dependency_tree_file:
+        # Write the sha as the first line of the dependency file.
+        repository_dependency_tree_file.write(sha + '\n')
+        # Write the remote url as the second line of the dependency file.
+        repository_dependency_tree_file.write(remote_url + '\n')
+        with report.timed('collect_dependency_files', repository):
             # Get all dependency files.
-            dependency_files = get_all_files_named(dependency_tree_output)
+            dependency_files = get_all_files_named(dependency_tree_output, start_dir=repository)
             for dependency_file in dependency_files:
-                with open(dependency_file, 'r') as f:
-                    temp_repository_dependency_tree_file.write(f.read())
-            # Reset the current directory.
-            os.chdir('..')
+                with open(dependency_file, 'rb') as f:
+                    shutil.copyfileobj(f, repository_dependency_tree_file, COPY_BUFFER_SIZE)
+
+def get_dependency_tree_command(maven_command, maven_dependency_plugin_version, dependency_tree_output):
+    return shlex.split(maven_command) + ['org.apache.maven.plugins:maven-dependency-plugin:{}:tree'.format(maven_dependency_plugin_version), '-DoutputFile={}'.format(dependency_tree_output)]
+
+def update_repository_dependency_file(repository, maven_dependency_plugin_version, dependency_tree_output, survive_error=False, report=None, maven_command='mvn'):
+    # Every command is run with the repository as its working directory rather than changing the
+    # process directory so that several repositories can be worked on at the same time.
+    # Returns one of 'refreshed', 'skipped' or 'failed'.
+    report = report or RunReport()
+    if debug:
+        print ''
+        print 'Working with repository {}'.format(repository)
+        sys.stdout.flush()
+    status, sha, remote_url = check_repository_dependency_file(repository, dependency_tree_output, report)
+    if status != 'stale':
+        return status
+
+    cmd = get_dependency_tree_command(maven_command, maven_dependency_plugin_version, dependency_tree_output)
+    print 'Running command "{}" in {}'.format(' '.join(cmd), repository)
+    sys.stdout.flush()
+    with report.timed('mvn', repository, subprocess=True) as event:
+        (output, err) = runExternalCommand(cmd, survive_error=survive_error, cwd=repository)
+        if output is None:
+            event['status'] = 'failed'
+    sys.stdout.flush()
+    if output is None:
+        # Leave any previous dependency file in place so the repository is retried on the next run.
+        return 'failed'
+    write_repository_dependency_file(repository, sha, remote_url, dependency_tree_output, report)
+    return 'refreshed'
+
+def skip_resumed_repositories(repositories, dependency_tree_output, journal, summary):
+    # Repositories the journal has as done at their current sha, that still have their dependency file, are counted
+    # as skipped. Returns the rest.
+    if journal is None:
+        return repositories
+    resumed = [repository for repository in repositories if journal.succeeded(repository, read_head_sha(repository))
+               and os.path.isfile('{}.{}'.format(repository, dependency_tree_output))]
+    if resumed:
+        print 'Skipping {} repositories finished by the previous run.'.format(len(resumed))
+    summary['skipped'].extend(resumed)
+    resumed = set(resumed)
+    return [repository for repository in repositories if repository not in resumed]
+
+def print_update_summary(summary):
+    print ''
+    print 'Dependency files refreshed: {}, skipped: {}, failed: {}'.format(len(summary['refreshed']), len(summary['skipped']), len(summary['failed']))
+    for repository in sorted(summary['failed']):
+        print '    failed: {}'.format(repository)
+    sys.stdout.flush()
+
+def write_reactor_pom(repositories, file_name):
+    # Aggregator pom with the repositories as modules. It has no parent so nothing has to be resolved for it.
+    with open(file_name, 'w') as pom:
+        pom.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        pom.write('<project xmlns="http://maven.apache.org/POM/4.0.0">\n')
+        pom.write('    <modelVersion>4.0.0</modelVersion>\n')
+        pom.write('    <groupId>com.dell.cpsd</groupId>\n')
+        pom.write('    <artifactId>dependency-tree-reactor</artifactId>\n')
+        pom.write('    <version>1.0-SNAPSHOT</version>\n')
+        pom.write('    <packaging>pom</packaging>\n')
+        pom.write('    <modules>\n')
+        for repository in repositories:
+            pom.write('        <module>{}</module>\n'.format(repository))
+        pom.write('    </modules>\n')
+        pom.write('</project>\n')
+
+def get_module_directories(repository):
+    # Directory of every module maven builds for the repository, or None when the poms can not be read.
+    try:
+        return [os.path.dirname(pom.path) for pom in read_repository_poms(repository)]
+    except PomError as e:
+        print e
+        return None
+
+def create_update_dependency_files_reactor(repositories, maven_dependency_plugin_version, dependency_tree_output, maven_command='mvn', report=None, journal=None):
+    # One maven run over an aggregator pom of every repository that needs a new dependency file, so the JVM start,
+    # plugin resolution and local repository scan are paid once. Every module still writes its own output file,
+    # which is collected per repository exactly like after a run in the repository itself. --fail-at-end lets the
+    # other repositories finish when one fails. A repository counts as refreshed when every one of its modules wrote its file.
+    summary = {'refreshed': [], 'skipped': [], 'failed': []}
+    report = report or RunReport()
+    repositories = skip_resumed_repositories(repositories, dependency_tree_output, journal, summary)
+    stale = []
+    for repository in repositories:
+        status, sha, remote_url = check_repository_dependency_file(repository, dependency_tree_output, report)
+        if status == 'stale':
+            module_directories = get_module_directories(repository)
+            if module_directories is None:
+                status = 'failed'
+            else:
+                stale.append((repository, sha, remote_url, module_directories))
+                # Output of an earlier run must not pass for output of this one.
+                for dependency_file in get_all_files_named(dependency_tree_output, start_dir=repository):
+                    os.remove(dependency_file)
+        if status != 'stale':
+            summary[status].append(repository)
+            if journal is not None:
+                journal.record(repository, status, sha)
+
+    if stale:
+        reactor_pom = '.dependency_tree_reactor.xml'
+        write_reactor_pom([stale_entry[0] for stale_entry in stale], reactor_pom)
+        cmd = get_dependency_tree_command(maven_command, maven_dependency_plugin_version, dependency_tree_output)
+        cmd[len(shlex.split(maven_command)):0] = ['-f', reactor_pom, '--fail-at-end']
+        print 'Running command "{}" over {} repositories'.format(' '.join(cmd), len(stale))
         sys.stdout.flush()
+        start = time.time()
+        with report.timed('mvn_reactor', subprocess=True) as event:
+            (output, err) = runExternalCommand(cmd, survive_error=True)
+            if output is None:
+                event['status'] = 'failed'
+        seconds = (time.time() - start) / len(stale)
+        os.remove(reactor_pom)
+        for repository, sha, remote_url, module_directories in stale:
+            if all(os.path.isfile(os.path.join(directory, dependency_tree_output)) for directory in module_directories):
+                write_repository_dependency_file(repository, sha, remote_url, dependency_tree_output, report)
+                status = 'refreshed'
+            else:
+                status = 'failed'
+            summary[status].append(repository)
+            if journal is not None:
+                # Maven reports no time per repository, the reactor time is shared out evenly.
+                journal.record(repository, status, sha, seconds)
+
+    print_update_summary(summary)
+    return summary
 
-        # If there exists a previous dependency file remove it
-        if old_sha:
-            os.remove(repository_dependency_tree_file_name)
-        # Now rename the temp file to the dependency file name
-        os.rename(temp_repository_dependency_tree_file_name, repository_dependency_tree_file_name)
+def _update_repository_dependency_file_worker(worker_args):
+    # Timings recorded in the worker process are handed back so the parent can merge them into its report.
+    repository, maven_dependency_plugin_version, dependency_tree_output, survive_error, maven_command = worker_args
+    report = RunReport()
+    start = time.time()
+    try:
+        status = update_repository_dependency_file(repository, maven_dependency_plugin_version, dependency_tree_output, survive_error, report, maven_command)
+    except Exception as e:
+        print 'Unexpected error updating repository {}: {}'.format(repository, e)
+        sys.stdout.flush()
+        status = 'failed'
+    return repository, status, report.events, time.time() - start
+
+def create_update_dependency_files(repositories, maven_dependency_plugin_version, dependency_tree_output, jobs=1, report=None, journal=None, maven_command='mvn'):
+    # A failing repository is reported at the end instead of stopping the run. With a journal
+    # every repository is recorded, and repositories the journal has as done at their current sha are left alone.
+    summary = {'refreshed': [], 'skipped': [], 'failed': []}
+    report = report or RunReport()
+    repositories = skip_resumed_repositories(repositories, dependency_tree_output, journal, summary)
+    worker_args = [(repository, maven_dependency_plugin_version, dependency_tree_output, True, maven_command) for repository in repositories]
+    if jobs <= 1:
+        results = (_update_repository_dependency_file_worker(args) for args in worker_args)
+        pool = None
+    else:
+        pool = Pool(jobs)
+        results = pool.imap_unordered(_update_repository_dependency_file_worker, worker_args)
+    try:
+        for repository, status, events, seconds in results:
+            summary[status].append(repository)
+            report.merge(events)
+            if journal is not None:
+                journal.record(repository, status, read_head_sha(repository), seconds)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print_update_summary(summary)
+    return summary
 
 def parse_artifact(artifact_line):
     artifact_info = artifact_line.split(':')
@@ -228,121 +514,257 @@ def parse_artifact(artifact_line):
         phase = artifact_info[4]
     return group_id, name, type, version, phase
 
-def read_dependency_info(repositories, dependency_tree_output, comparison_group_id):
+def parse_dependency_tree(lines):
+    # Stream the lines of a dependency tree file once and yield (depth, parent_coordinates, coordinates) per artifact.
+    # Depth 0 is a module of the repository itself and has no parent.
+    parents = []
+    for line in lines:
+        match = DEPENDENCY_TREE_LINE.match(line)
+        if not match:
+            continue
+        depth = len(match.group(1)) // 3
+        coordinates = match.group(2)
+        del parents[depth:]
+        parent = parents[-1] if parents else None
+        parents.append(coordinates)
+        yield depth, parent, coordinates
+
+def artifact_key(coordinates):
+    # group_id:name:type:version with the phase dropped
+    return ':'.join(coordinates.split(':', 4)[:4])
+
+def parse_repository_dependency_info(lines, comparison_group_id, tree_edges=False):
+    artifacts = []
+    # Use a dictionary to store dependencies to eliminate duplicates
+    group_dependencies = {}
+    other_dependencies = {}
+    group_dependencies_non_versioned = {}
+    # (depth, parent, child) for every edge of the tree, artifacts keyed as group_id:name:type:version. Only kept when asked for.
+    dependency_tree_edges = []
+    for depth, parent, coordinates in parse_dependency_tree(lines):
+        if depth == 0 and coordinates.startswith(comparison_group_id):
+            artifacts.append(intern_string(coordinates))
+            continue
+        new_artifact_entry = artifact_from_coordinates(coordinates, parse_artifact)
+        key = new_artifact_entry.key
+        # I could compare against group_id but there are still artifacts in which the group id is not correct.
+        if coordinates.startswith(comparison_group_id):
+            group_dependencies[key] = new_artifact_entry
+            group_dependencies_non_versioned[intern_string(new_artifact_entry.group_id + ':' + new_artifact_entry.name)] = new_artifact_entry
+        else:
+            other_dependencies[key] = new_artifact_entry
+        if tree_edges and parent is not None:
+            dependency_tree_edges.append(dependency_tree_edge(depth, artifact_key(parent), key))
+    # Special case multi module repositories where one module has dependencies on another within the same repository
+    # They shouldn't end up in either group_dependencies or group_dependencies_non_version
+    # This should remove them.
+    repository_artifact_names = set(parse_artifact(artifact)[1] for artifact in artifacts)
+    if repository_artifact_names:
+        group_dependencies = dict((k, v) for k, v in group_dependencies.iteritems() if v['name'] not in repository_artifact_names)
+        group_dependencies_non_versioned = dict((k, v) for k, v in group_dependencies_non_versioned.iteritems() if v['name'] not in repository_artifact_names)
+    dependency_info = {'artifacts': artifacts, 'group_dependencies': group_dependencies, 'group_dependencies_non_versioned': group_dependencies_non_versioned, 'other_dependencies': other_dependencies}
+    if tree_edges:
+        dependency_info['dependency_tree_edges'] = dependency_tree_edges
+    return dependency_info
+
+def read_pom_dependency_info(repositories, comparison_group_id, report=None, tree_edges=False):
+    # Fast alternative to create_update_dependency_files + read_dependency_info that never runs maven.
+    repositories_dependency_information = {}
+    report = report or RunReport()
+    for repository in repositories:
+        with report.timed('parse_pom', repository) as event:
+            try:
+                repositories_dependency_information[repository] = read_repository_pom_info(repository, comparison_group_id, tree_edges)
+            except PomError as e:
+                event['status'] = 'failed'
+                print 'Skipping repository {}. {}'.format(repository, e)
+                sys.stdout.flush()
+    return repositories_dependency_information
+
+def read_repository_urls(workspace_entries):
+    # {repository: (sha, remote url)} from scan_workspace for when there are no dependency tree files.
+    # git only runs for the repositories whose HEAD could not be read from the files under .git.
+    repository_urls = {}
+    for entry in workspace_entries:
+        sha = entry['sha'] or get_current_branch_head(cwd=entry['name'])
+        remote_url = entry['remote_url'] if entry['remote_url'] is not None else get_current_remote_url(cwd=entry['name'])
+        repository_urls[entry['name']] = (sha, remote_url)
+    return repository_urls
+
+def read_dependency_info(repositories, dependency_tree_output, comparison_group_id, cache=None, report=None, repository_urls=None, tree_edges=False):
+    # repository_urls is an optional dictionary that gets the (sha, remote url) heading every dependency file.
+    # tree_edges also keeps the dependency_tree_edges of every repository.
     repositories_dependency_information = {}
+    report = report or RunReport()
     for repository in repositories:
-        artifacts = []
-        # Use a dictionary to store dependencies to eliminate duplicates
-        group_dependencies = {}
-        other_dependencies = {}
-        group_dependencies_non_versioned = {}
         repository_dependency_tree_file_name = repository + '.{}'.format(dependency_tree_output)
-        with open(repository_dependency_tree_file_name, 'r') as repository_dependency_tree_file:
-            # Skip the sha line
-            line = repository_dependency_tree_file.readline()
-            # Skip the remote url line
-            line = repository_dependency_tree_file.readline()
-            line = repository_dependency_tree_file.readline().strip()
-            while line:
-                if line.startswith(comparison_group_id):
-                    artifacts.append(line)
-                else:
-                    # Remove the visual characters from the line.
-                    # I have had some issues when I group regular expressions so I'm going to do them one at a time.
-                    line = re.sub('\+',   '', line)
-                    line = re.sub('-',    '', line, 1) # Sub only the first dash to avoid to renaming artifacts
-                    line = re.sub(' ',    '', line)
-                    line = re.sub('\|',   '', line)
-                    line = re.sub('\\\\', '', line)
-                    group_id, name, type, version, phase = parse_artifact(line)
-                    # Eliminate the phase entry as we are not really interested in it
-                    new_artifact_entry = {'group_id': group_id, 'name': name, 'type': type, 'version': version, 'phase': phase}
-                    # I could compare against group_id but there are still artifacts in which the group id is not correct.
-                    if line.startswith(comparison_group_id):
-                        group_dependencies[group_id + ':' + name + ':' + type + ':' + version] = new_artifact_entry
-                        group_dependencies_non_versioned[group_id + ':' + name] = new_artifact_entry
-                    else:
-                        other_dependencies[group_id + ':' + name + ':' + type + ':' + version] = new_artifact_entry
-                line = repository_dependency_tree_file.readline().strip()
-        # Special case multi module repositories where one module has dependencies on another within the same repository
-        # They shouldn't end up in either group_dependencies or group_dependencies_non_version
-        # This should remove them.
-        for artifact in artifacts:
-            group_id, name, type, version, phase = parse_artifact(artifact)
-            for dependency_artifact, dependency_artifact_info in sorted(group_dependencies_non_versioned.iteritems()):
-                if name == dependency_artifact_info['name']:
-                    del group_dependencies_non_versioned[dependency_artifact]
-                    break
-            for dependency_artifact, dependency_artifact_info in sorted(group_dependencies.iteritems()):
-                if name == dependency_artifact_info['name']:
-                    del group_dependencies[dependency_artifact]
-                    break
-        repositories_dependency_information[repository] = {'artifacts': artifacts, 'group_dependencies': group_dependencies, 'group_dependencies_non_versioned': group_dependencies_non_versioned, 'other_dependencies': other_dependencies}
+        with report.timed('parse', repository), open(repository_dependency_tree_file_name, 'r') as repository_dependency_tree_file:
+            sha = repository_dependency_tree_file.readline().strip()
+            remote_url = repository_dependency_tree_file.readline().strip()
+            if repository_urls is not None:
+                repository_urls[repository] = (sha, remote_url)
+            if cache is not None:
+                file_signature = cache.file_signature(repository_dependency_tree_file_name)
+                dependency_info = cache.get(repository, sha, comparison_group_id, file_signature)
+                if dependency_info is not None and tree_edges and 'dependency_tree_edges' not in dependency_info:
+                    # Cached by a run without edges.
+                    dependency_info = None
+                if dependency_info is None:
+                    dependency_info = parse_repository_dependency_info(repository_dependency_tree_file, comparison_group_id, tree_edges)
+                    cache.put(repository, sha, comparison_group_id, file_signature, dependency_info)
+                elif not tree_edges:
+                    dependency_info.pop('dependency_tree_edges', None)
+            else:
+                dependency_info = parse_repository_dependency_info(repository_dependency_tree_file, comparison_group_id, tree_edges)
+        repositories_dependency_information[repository] = dependency_info
     return repositories_dependency_information
 
 
-def update_artifacts_already_generated(artifacts_already_generated_by_previous_groups, artifacts):
-    for artifact in artifacts:
-        group_id, name, type, version, phase = parse_artifact(artifact)
-        artifacts_already_generated_by_previous_groups[name] = 1
-    return artifacts_already_generated_by_previous_groups
-
-
-def find_next_group_of_dependents(artifacts_already_generated_by_previous_groups, repository_info):
-    # List of repositories that have been identified as belonging to this current group.
-    current_group_repositories = []
-    # We are going to remove keys from the repository info so preserve the original and return the modified copy
-    temp_repository_info = repository_info
-    # We are going to add artifacts to a copy of this dictionary and then copy the results at the end of the loop
-    temp_artifacts_already_generated_by_previous_groups = artifacts_already_generated_by_previous_groups
-    # If this routine is hit for the first time there will be no artifacts from previous groups. Use this as a flag for the first run.
-    previously_run = True
-    if not artifacts_already_generated_by_previous_groups:
-        previously_run = False
-    for repository, dependency_info in sorted(temp_repository_info.iteritems()):
-        if debug:
-            print 'Working with repository {}'.format(repository)
-            sys.stdout.flush()
-        # Special case for the first group with no group dependencies
-        if not previously_run:
-            if not dependency_info['group_dependencies_non_versioned']:
+def create_artifact_producer_index(repository_dependency_info):
+    # Map every artifact name to the repository that produces it.
+    artifact_producers = {}
+    for repository, dependency_info in sorted(repository_dependency_info.iteritems()):
+        for artifact in dependency_info['artifacts']:
+            group_id, name, type, version, phase = parse_artifact(artifact)
+            if name in artifact_producers and artifact_producers[name] != repository:
                 if debug:
-                    print 'Repository {} is a stand alone repository with no internal dependencies.'.format(repository)
-                    sys.stdout.flush()
-                for artifact in dependency_info['artifacts']:
-                    group_id, name, type, version, phase = parse_artifact(artifact)
-                    artifacts_already_generated_by_previous_groups[name] = 1
-                current_group_repositories.append(repository)
-                del temp_repository_info[repository] 
-        else:
-            unfounded_dependencies = False
-            for artifact, artifact_info in sorted(dependency_info['group_dependencies_non_versioned'].iteritems()):
-                if not artifact_info['name'] in artifacts_already_generated_by_previous_groups:
-                    if debug:
-                        print 'Dependent artifact {} not found in previous groups of generated artifacts.'.format(artifact_info['name'])
-                        print 'Skipping repository {} for this group'.format(repository)
-                        print ''
-                        sys.stdout.flush()
-                    unfounded_dependencies = True
+                    print 'Artifact {} is produced by both {} and {}. Using {}.'.format(name, artifact_producers[name], repository, artifact_producers[name])
+                continue
+            artifact_producers[name] = repository
+    return artifact_producers
+
+
+def create_repository_dependency_graph(repository_dependency_info, artifact_producers):
+    # Returns three dictionaries keyed by repository
+    #   upstream   - {upstream repository: [artifact names it supplies]}
+    #   downstream - [repositories that depend on this one]
+    #   missing    - [artifact names that no repository in the workspace produces]
+    upstream = {}
+    downstream = {}
+    missing = {}
+    for repository in repository_dependency_info:
+        upstream[repository] = {}
+        downstream[repository] = []
+        missing[repository] = []
+    for repository, dependency_info in repository_dependency_info.iteritems():
+        for artifact_info in dependency_info['group_dependencies_non_versioned'].itervalues():
+            name = artifact_info['name']
+            producer = artifact_producers.get(name)
+            if producer is None:
+                missing[repository].append(name)
+            elif producer != repository:
+                if producer not in upstream[repository]:
+                    upstream[repository][producer] = []
+                    downstream[producer].append(repository)
+                upstream[repository][producer].append(name)
+    return upstream, downstream, missing
+
+
+def find_dependency_cycles(repositories, upstream):
+    # Tarjan's strongly connected components restricted to the given repositories.
+    # Every component with more than one repository contains at least one cycle, walk it to report the exact edges.
+    repositories = set(repositories)
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = [0]
+
+    def strongconnect(root):
+        # Iterative so a long dependency chain can not hit the recursion limit.
+        work = [(root, iter(sorted(upstream[root])))]
+        index[root] = lowlink[root] = counter[0]
+        counter[0] += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            repository, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in repositories:
+                    continue
+                if child not in index:
+                    index[child] = lowlink[child] = counter[0]
+                    counter[0] += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(upstream[child]))))
+                    advanced = True
                     break
-            if not unfounded_dependencies:
-                temp_artifacts_already_generated_by_previous_groups = update_artifacts_already_generated(temp_artifacts_already_generated_by_previous_groups, dependency_info['artifacts'])
-                current_group_repositories.append(repository)
-                del temp_repository_info[repository] 
-    # Add the changes to the artifacts generated as part of this group
-    artifacts_already_generated_by_previous_groups = temp_artifacts_already_generated_by_previous_groups 
-    return artifacts_already_generated_by_previous_groups, temp_repository_info, current_group_repositories
+                elif child in on_stack:
+                    lowlink[repository] = min(lowlink[repository], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[repository])
+            if lowlink[repository] == index[repository]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == repository:
+                        break
+                if len(component) > 1:
+                    components.append(set(component))
 
+    for repository in sorted(repositories):
+        if repository not in index:
+            strongconnect(repository)
 
-def create_non_version_dependency_groups(repository_dependency_info):
-    group_num = 0
-    previously_generated_artifacts = {}
+    cycles = []
+    for component in components:
+        # Follow edges inside the component until a repository repeats. That loop is a cycle.
+        path = [min(component)]
+        seen = {path[0]: 0}
+        while True:
+            next_repository = min(r for r in upstream[path[-1]] if r in component)
+            if next_repository in seen:
+                path = path[seen[next_repository]:] + [next_repository]
+                break
+            seen[next_repository] = len(path)
+            path.append(next_repository)
+        cycles.append([(path[i], sorted(upstream[path[i]][path[i + 1]]), path[i + 1]) for i in range(len(path) - 1)])
+    return cycles
+
+
+def compute_build_groups(repository_dependency_info):
+    # Layered topological sort (Kahn) over the repository graph.
+    # Each group only holds repositories whose dependencies were all produced by earlier groups.
+    # Returns (groups, repositories that could not be placed, upstream, downstream, missing) without printing anything.
+    artifact_producers = create_artifact_producer_index(repository_dependency_info)
+    upstream, downstream, missing = create_repository_dependency_graph(repository_dependency_info, artifact_producers)
+    pending_count = dict((repository, len(upstream[repository])) for repository in repository_dependency_info)
+    blocked = set(repository for repository in repository_dependency_info if missing[repository])
+
+    groups = []
+    placed_repositories = set()
+    current_group_repositories = sorted(r for r, count in pending_count.iteritems() if count == 0 and r not in blocked)
+    while current_group_repositories:
+        groups.append(current_group_repositories)
+        placed_repositories.update(current_group_repositories)
+        next_group_repositories = []
+        for repository in current_group_repositories:
+            for dependent in downstream[repository]:
+                pending_count[dependent] -= 1
+                if pending_count[dependent] == 0 and dependent not in blocked:
+                    next_group_repositories.append(dependent)
+        current_group_repositories = sorted(next_group_repositories)
+    remaining = sorted(r for r in repository_dependency_info if r not in placed_repositories)
+    return groups, remaining, upstream, downstream, missing
+
+
+def create_non_version_dependency_groups(repository_dependency_info, build_groups=None):
+    # build_groups is an optional compute_build_groups result so the caller can reuse the graph.
+    if build_groups is None:
+        build_groups = compute_build_groups(repository_dependency_info)
+    groups, remaining, upstream, downstream, missing = build_groups
     non_version_dependency_groups = []
-    countdown_dependency_info = repository_dependency_info.copy()
-    while countdown_dependency_info:
-        if debug:
-            print 'Previously Generated Artifacts = {}'.format(previously_generated_artifacts)
-        previously_generated_artifacts, countdown_dependency_info, current_group_repositories = find_next_group_of_dependents(previously_generated_artifacts, countdown_dependency_info)
+    group_num = 0
+    for current_group_repositories in groups:
         print '--------------------------------------------------------------------------------'
         print 'group_num {} has {} repositories.'.format(group_num, len(current_group_repositories))
         for repo in current_group_repositories:
@@ -350,140 +772,347 @@ def create_non_version_dependency_groups(repository_dependency_info):
         print '--------------------------------------------------------------------------------'
         sys.stdout.flush()
         non_version_dependency_groups.append(current_group_repositories)
-        if not current_group_repositories:
-            print '... Halting issue.'
-            print ''
-            print 'The following repositories cannot find dependencies in the artifacts that have already been processed.'
-            print ''
-            for repository, dependency_info in sorted(countdown_dependency_info.iteritems()):
-                print '{}'.format(repository)
-            break
         group_num += 1
+
+    if remaining:
+        print '--------------------------------------------------------------------------------'
+        print 'group_num {} has 0 repositories.'.format(group_num)
+        print '--------------------------------------------------------------------------------'
+        non_version_dependency_groups.append([])
+        print '... Halting issue.'
+        print ''
+        print 'The following repositories cannot find dependencies in the artifacts that have already been processed.'
+        print ''
+        for repository in remaining:
+            print '{}'.format(repository)
+        for repository in remaining:
+            if missing[repository]:
+                print ''
+                print 'Repository {} depends on artifacts no repository produces: {}'.format(repository, ', '.join(sorted(set(missing[repository]))))
+        for cycle in find_dependency_cycles(remaining, upstream):
+            print ''
+            print 'Dependency cycle between {} repositories:'.format(len(cycle))
+            for repository, artifact_names, upstream_repository in cycle:
+                print '    {} needs {} from {}'.format(repository, ', '.join(artifact_names), upstream_repository)
+        sys.stdout.flush()
     return non_version_dependency_groups
 
-def create_html_list_header(html_file, title_text):
-    html_file.write('<!DOCTYPE html>\n')
-    html_file.write('<html>\n')
-    html_file.write('<head>\n')
-    html_file.write('<meta charset="ISO-8859-1">\n')
-    html_file.write('<title>' + title_text + '</title>\n')
-    html_file.write('<link rel="shortcut icon" href="table.png">')
-    html_file.write('<style>\n')
-    html_file.write('tr:nth-of-type(odd) {\n')
-    html_file.write('background-color: lightgreen;\n')
-    html_file.write('}\n')
-    html_file.write('tr:nth-of-type(even) {\n')
-    html_file.write('  background-color: #A3FF4B;\n')
-    html_file.write('}\n')
-    html_file.write('  .build_order_width {\n')
-    html_file.write('    width: 110px;\n')
-    html_file.write('  }\n')
-    html_file.write('  .build_job_width {\n')
-    html_file.write('    width: 320px;\n')
-    html_file.write('  }\n')
-    html_file.write('</style>\n')
-    html_file.write('</head>\n')
-    html_file.write('<body>\n')
-    html_file.write('<h2 align="center">'+title_text+'</h2>\n')
-
-
-def create_html_end_of_report(html_file):
-    html_file.write('  <br>\n')
-    html_file.write('  <br>\n')
-    html_file.write('  <h4>Report created on ' + REPORT_GENERATED_TIME +'</h4>\n')
-    html_file.write('</body>\n')
-    html_file.write('</html>\n')
-
-
-def create_non_version_dependency_groups_html_report(non_version_dependency_groups, dependency_tree_output_file):
+
+def create_reverse_dependency_index(repository_dependency_info):
+    # Everything an impact query needs, small enough to load in a few milliseconds.
+    artifact_producers = create_artifact_producer_index(repository_dependency_info)
+    upstream, downstream, missing = create_repository_dependency_graph(repository_dependency_info, artifact_producers)
+    return {'artifact_producers': artifact_producers, 'downstream': dict((repository, sorted(dependents)) for repository, dependents in downstream.iteritems())}
+
+
+def write_reverse_dependency_index(reverse_dependency_index, file_name):
+    with atomic_write(file_name) as f:
+        json.dump(reverse_dependency_index, f, sort_keys=True)
+
+
+def read_reverse_dependency_index(file_name):
+    with open(file_name, 'r') as f:
+        return json.load(f)
+
+
+def find_impacted_repositories(reverse_dependency_index, changed):
+    # changed is a list of repository or artifact names (group_id:name is accepted as well).
+    # Returns (changed repositories, unknown names, build groups of the changed and all downstream repositories).
+    downstream = reverse_dependency_index['downstream']
+    artifact_producers = reverse_dependency_index['artifact_producers']
+    changed_repositories = set()
+    unknown = []
+    for name in changed:
+        name = name.strip()
+        if name in downstream:
+            changed_repositories.add(name)
+        elif name in artifact_producers:
+            changed_repositories.add(artifact_producers[name])
+        elif name.split(':')[-1] in artifact_producers:
+            changed_repositories.add(artifact_producers[name.split(':')[-1]])
+        elif name:
+            unknown.append(name)
+
+    impacted = set(changed_repositories)
+    pending = list(changed_repositories)
+    while pending:
+        for dependent in downstream[pending.pop()]:
+            if dependent not in impacted:
+                impacted.add(dependent)
+                pending.append(dependent)
+
+    # Layered topological sort of the impacted slice only.
+    pending_count = dict((repository, 0) for repository in impacted)
+    for repository in impacted:
+        for dependent in downstream[repository]:
+            pending_count[dependent] += 1
+    groups = []
+    current_group = sorted(r for r, count in pending_count.iteritems() if count == 0)
+    while current_group:
+        groups.append(current_group)
+        next_group = []
+        for repository in current_group:
+            for dependent in downstream[repository]:
+                pending_count[dependent] -= 1
+                if pending_count[dependent] == 0:
+                    next_group.append(dependent)
+        current_group = sorted(next_group)
+    return sorted(changed_repositories), unknown, groups
+
+
+def find_dependents_in_store(store_file, names):
+    # Names the reverse dependency index does not know, third party artifacts for example, are looked up in the
+    # dependencies of the binary store. group_id:name is accepted as well, any version matches.
+    # Returns ({name: repositories depending on it}, names no repository depends on).
+    dependents = {}
+    unknown = []
+    store = DependencyStore(store_file)
+    try:
+        for name in names:
+            artifact_name = name.split(':')[-1]
+            repositories = set(store.dependents_of(artifact_name, 'group_dependencies') + store.dependents_of(artifact_name, 'other_dependencies'))
+            if repositories:
+                dependents[name] = sorted(repositories)
+            else:
+                unknown.append(name)
+    finally:
+        store.close()
+    return dependents, unknown
+
+def refresh_dependency_store(data_file, store_file):
+    # The binary store has to match the last run. A run that only wrote the JSON data file leaves an older store,
+    # or none, behind. That store is rebuilt from the JSON file once, later queries use it as it is.
+    # Returns False when neither file exists.
+    if os.path.isfile(data_file) and (not os.path.isfile(store_file) or os.path.getmtime(store_file) < os.path.getmtime(data_file)):
+        print 'Writing {} from the newer {}.'.format(store_file, data_file)
+        with open(data_file, 'r') as f:
+            repository_dependency_info = json.load(f)
+        write_dependency_store(repository_dependency_info, store_file)
+    return os.path.isfile(store_file)
+
+def print_impacted_repositories(args):
+    try:
+        reverse_dependency_index = read_reverse_dependency_index(args['reverse_dependency_index_file'])
+    except IOError:
+        print 'No reverse dependency index {}. Run once without --impacted_by to create it.'.format(args['reverse_dependency_index_file'])
+        exit(1)
+    changed = [name.strip() for name in args['impacted_by'].split(',')]
+    changed_repositories, unknown, groups = find_impacted_repositories(reverse_dependency_index, changed)
+    if unknown and refresh_dependency_store(DEPENDENCY_DATA_FILE, DEPENDENCY_STORE_FILE):
+        # The repositories depending on an artifact no repository produces have to be rebuilt when it changes.
+        dependents, still_unknown = find_dependents_in_store(DEPENDENCY_STORE_FILE, unknown)
+        for name, repositories in sorted(dependents.iteritems()):
+            print 'Repositories depending on "{}": {}'.format(name, ', '.join(repositories))
+        changed = [name for name in changed if name not in dependents] + sum(dependents.values(), [])
+        changed_repositories, unknown, groups = find_impacted_repositories(reverse_dependency_index, changed)
+    for name in unknown:
+        print 'Unknown repository or artifact "{}"'.format(name)
+    print 'Changed repositories: {}'.format(', '.join(changed_repositories))
+    group_num = 0
+    for group in groups:
+        print '--------------------------------------------------------------------------------'
+        print 'group_num {} has {} repositories.'.format(group_num, len(group))
+        for repo in group:
+            print '{}'.format(repo)
+        group_num += 1
+    print '--------------------------------------------------------------------------------'
+    sys.stdout.flush()
+    if 'impacted_output' in args:
+        with open(args['impacted_output'], 'w') as f:
+            json.dump({'changed': changed_repositories, 'unknown': unknown, 'groups': groups}, f, indent=2)
+    if unknown:
+        exit(1)
+
+def create_non_version_dependency_groups_html_report(non_version_dependency_groups, repository_urls, build_schedule=None, page_size=0):
+    # repository_urls is {repository: (sha, remote url)} as read while parsing, nothing is read from disk here.
+    # build_schedule is an optional compute_build_schedule result that adds build times, start times and slack.
+    # A page_size splits workspaces with more repositories than that over several pages.
     print ''
-    title = 'Symphony Build Order'
-    html_file_name = 'symphony_build_order.html'
-    temp_html_file_name = html_file_name + '.tmp'
-    # If a temporary version is leftover just delete and start from scratch.
-    if os.path.exists(temp_html_file_name):
-        os.remove(temp_html_file_name)
-    with open(temp_html_file_name, 'w') as temp_html_file:
-        create_html_list_header(temp_html_file, title)
-        temp_html_file.write('  <table border=1>\n')
-        temp_html_file.write('    <tbody>\n')
-        group_num = 0
-        for group in non_version_dependency_groups:
-            temp_html_file.write('      <tr style="color: black; background: lightgray;">\n')
-            temp_html_file.write('        <td>Build Group {}</td>'.format(group_num))
-            temp_html_file.write('      </tr>\n')
-            temp_html_file.write('      <tr>\n')
-            for repository in group:
-                sha= ''
-                git_url = ''
-                with open('{}.{}'.format(repository, dependency_tree_output_file), 'r') as f:
-                    sha = f.readline().strip()
-                    git_url = f.readline().strip()
-                organization = git_url.split('/')[3]
-                pipeline_build = ''
-                if organization == 'VCE-Symphony':
-                    pipeline_build ='http://ci-build.mpe.lab.vce.com:8080/job/vce-symphony/job/{}'.format(repository)
+    return write_build_order_report(non_version_dependency_groups, repository_urls, REPORT_GENERATED_TIME,
+                                    build_schedule=build_schedule, page_size=page_size)
+
+
+def create_version_drift_html_report(version_drift, html_file_name):
+    title = 'Symphony Dependency Version Drift'
+    parts = [render_header(title)]
+    summary = version_drift['summary']
+    parts.append('  <h4>{} internal and {} third party artifacts with drift, {} of {} repositories use a stale version</h4>\n'.format(
+        summary['internal_artifacts_with_drift'], summary['third_party_artifacts_with_drift'], summary['stale_repositories'], summary['repositories']))
+    for kind, heading in (('internal', 'Internal artifacts'), ('third_party', 'Third party artifacts')):
+        parts.append('  <h3>{}</h3>\n'.format(heading))
+        parts.append('  <table border=1>\n')
+        parts.append('    <tbody>\n')
+        parts.append('      <tr style="color: black; background: lightgray;">\n')
+        parts.append('        <td>Artifact</td><td>Current version</td><td>Version</td><td>Repositories</td>\n')
+        parts.append('      </tr>\n')
+        for artifact in version_drift[kind]:
+            current = artifact['current_version']
+            if artifact['producer']:
+                current += ' (built by {})'.format(artifact['producer'])
+            for version, repositories in sorted(artifact['versions'].iteritems()):
+                stale = any(artifact['stale'].get(r) == version for r in repositories)
+                parts.append('      <tr>\n')
+                parts.append('        <td>{}</td><td>{}</td>'.format(escape(artifact['artifact']), escape(current)))
+                if stale:
+                    parts.append('<td style="color: red;"><b>{}</b></td>'.format(escape(version)))
                 else:
-                    if re.match('^[a-c].*', repository):
-                        pipeline_build = 'http://ci-build.mpe.lab.vce.com:8080/job/dellemc-symphony1/job/{}'.format(repository)
-                    if re.match('^[d-h].*', repository):
-                        pipeline_build = 'http://ci-build.mpe.lab.vce.com:8080/job/dellemc-symphony2/job/{}'.format(repository)
-                    if re.match('^[i-q].*', repository):
-                        pipeline_build = 'http://ci-build.mpe.lab.vce.com:8080/job/dellemc-symphony3/job/{}'.format(repository)
-                    if re.match('^[r].*', repository):
-                        pipeline_build = 'http://ci-build.mpe.lab.vce.com:8080/job/dellemc-symphony4/job/{}'.format(repository)
-                    if re.match('^[s-z].*', repository):
-                        pipeline_build = 'http://ci-build.mpe.lab.vce.com:8080/job/dellemc-symphony5/job/{}'.format(repository)
-                temp_html_file.write('        <tr>\n'.format(repository))
-                temp_html_file.write('        <td><a href="{}">{}</a></td>\n'.format(git_url, repository))
-                temp_html_file.write('        <td><a href="{}">pipeline build</a></td>\n'.format(pipeline_build))
-                temp_html_file.write('        </tr>\n'.format(repository))
-            temp_html_file.write('      </tr>\n')
-            group_num += 1
-        temp_html_file.write('    </tbody>\n')
-        temp_html_file.write('  </table>\n')
-        create_html_end_of_report(temp_html_file)
-    if os.path.exists(html_file_name):
-        os.remove(html_file_name)
-    os.rename(temp_html_file_name, html_file_name)
-
-def main():
-    # Lets pull all of the arguments at once to force an error early if not available.
-    args = getArguments()
+                    parts.append('<td>{}</td>'.format(escape(version)))
+                parts.append('<td>{}</td>\n'.format(escape(', '.join(repositories))))
+                parts.append('      </tr>\n')
+        parts.append('    </tbody>\n')
+        parts.append('  </table>\n')
+    parts.append(render_footer(REPORT_GENERATED_TIME))
+    write_html_file(html_file_name, parts)
+
+
+def write_version_drift(version_drift, file_name):
+    with atomic_write(file_name) as f:
+        json.dump(version_drift, f, sort_keys=True, indent=2)
+    create_version_drift_html_report(version_drift, os.path.splitext(file_name)[0] + '.html')
+
+
+def run_daemon(args):
+    group_id                        = args['group_id']
+    dependency_tree_output_file     = args['dependency_tree_output_file']
+    maven_dependency_plugin_version = args['maven_dependency_plugin_version']
+
+    def read_repository(repository):
+        if args['dependency_source'] == 'maven':
+            update_repository_dependency_file(repository, maven_dependency_plugin_version, dependency_tree_output_file, survive_error=True, maven_command=args['maven_command'])
+            if not os.path.isfile('{}.{}'.format(repository, dependency_tree_output_file)):
+                return None
+            return read_dependency_info([repository], dependency_tree_output_file, group_id)[repository]
+        try:
+            return read_repository_pom_info(repository, group_id)
+        except PomError as e:
+            print 'Skipping repository {}. {}'.format(repository, e)
+            return None
+
+    daemon = DependencyGraphDaemon(lambda: get_maven_dirs('./', args['workspace_cache_file']), read_repository, compute_build_groups, create_reverse_dependency_index, find_impacted_repositories)
+    daemon.run(args['daemon_host'], int(args['daemon_port']), float(args['poll_interval']))
+
+def main(args, report):
     # This parameter has a default so we can already pull that value without worrying about an exception
     debug                           = args['debug']
     group_id                        = args['group_id']
     dependency_tree_output_file     = args['dependency_tree_output_file']
     maven_dependency_plugin_version = args['maven_dependency_plugin_version']
+    jobs                            = int(args['jobs'])
 
-    repositories = get_maven_dirs('./')
-    print '... Creating/Updating dependency files.'
-    print ''
-    sys.stdout.flush()
-    create_update_dependency_files(repositories, maven_dependency_plugin_version, dependency_tree_output_file)
-    print ''
-    print '... Dependency files created.'
-    print ''
-    print '... Parsing dependency information.'
-    print ''
-    sys.stdout.flush()
-    repository_dependency_info = read_dependency_info(repositories, dependency_tree_output_file, group_id)
+    if 'impacted_by' in args:
+        with report.timed('impact_query'):
+            print_impacted_repositories(args)
+        exit(0)
+
+    if 'daemon' in args:
+        run_daemon(args)
+        exit(0)
+
+    failed_repositories = []
+    with report.timed('scan_workspace'):
+        workspace_entries = [entry for entry in scan_workspace('./', args['workspace_cache_file']) if entry['has_pom']]
+    repositories = [entry['name'] for entry in workspace_entries]
+    if args['dependency_source'] == 'maven':
+        print '... Creating/Updating dependency files.'
+        print ''
+        sys.stdout.flush()
+        journal = RunJournal(args['journal_file'], resume='resume' in args)
+        if 'resume' in args:
+            journal.print_resume_summary()
+        try:
+            if args['maven_mode'] == 'reactor':
+                update_summary = create_update_dependency_files_reactor(repositories, maven_dependency_plugin_version, dependency_tree_output_file, args['maven_command'], report, journal)
+            else:
+                update_summary = create_update_dependency_files(repositories, maven_dependency_plugin_version, dependency_tree_output_file, jobs, report, journal, args['maven_command'])
+        finally:
+            journal.close()
+        failed_repositories = update_summary['failed']
+        # A failed repository keeps its previous dependency file if it had one. Without one there is nothing to parse.
+        repositories = [r for r in repositories if r not in update_summary['failed'] or os.path.isfile('{}.{}'.format(r, dependency_tree_output_file))]
+        print ''
+        print '... Dependency files created.'
+        print ''
+        print '... Parsing dependency information.'
+        print ''
+        sys.stdout.flush()
+        cache = None
+        if 'no_cache' not in args:
+            cache = DependencyCache(args['dependency_cache_file'], max_bytes=int(args['dependency_cache_max_mb']) * 1024 * 1024)
+        repository_urls = {}
+        repository_dependency_info = read_dependency_info(repositories, dependency_tree_output_file, group_id, cache, report, repository_urls, 'dependency_tree_edges' in args)
+        if cache is not None:
+            print '... Dependency cache hits: {}, misses: {}'.format(cache.hits, cache.misses)
+            cache.close()
+    else:
+        print '... Parsing pom.xml dependency information.'
+        print ''
+        sys.stdout.flush()
+        repository_dependency_info = read_pom_dependency_info(repositories, group_id, report, 'dependency_tree_edges' in args)
+        with report.timed('sha_lookup'):
+            repository_urls = read_repository_urls([entry for entry in workspace_entries if entry['name'] in repository_dependency_info])
     print '... Dependency information parsed.'
     print ''
     print '... Create Symphony build order groups'
     print ''
     sys.stdout.flush()
-    non_version_dependency_groups = create_non_version_dependency_groups(repository_dependency_info)
+    with report.timed('grouping'):
+        build_groups = compute_build_groups(repository_dependency_info)
+        non_version_dependency_groups = create_non_version_dependency_groups(repository_dependency_info, build_groups)
+    groups, remaining, upstream, downstream, missing = build_groups
+    with report.timed('build_schedule'):
+        build_schedule = compute_build_schedule(groups, upstream, downstream, read_build_timings(args['build_timings_file']))
+        write_build_schedule(build_schedule, args['build_schedule_file'])
+    print ''
+    print_build_schedule(build_schedule)
+    with report.timed('reverse_dependency_index'):
+        write_reverse_dependency_index(create_reverse_dependency_index(repository_dependency_info), args['reverse_dependency_index_file'])
     print ''
     print '... Symphony build order groups created.'
     print ''
     print '... Create Symphony build order html page.'
-    create_non_version_dependency_groups_html_report(non_version_dependency_groups, dependency_tree_output_file)
+    with report.timed('html_report'):
+        create_non_version_dependency_groups_html_report(non_version_dependency_groups, repository_urls, build_schedule, int(args['html_page_size']))
     print '... Symphony build order html page created.'
     print ''
-    with open('symphony_dependency_order_data.json', 'w') as f:
-        json.dump(repository_dependency_info, f, sort_keys = True, indent=2, ensure_ascii = False)
+    if 'version_drift' in args:
+        with report.timed('version_drift'):
+            version_drift = analyze_version_drift(repository_dependency_info)
+            write_version_drift(version_drift, args['version_drift_file'])
+        print '... Version drift: {internal_artifacts_with_drift} internal and {third_party_artifacts_with_drift} third party artifacts, {stale_repositories} repositories on stale versions.'.format(**version_drift['summary'])
+        print ''
+    if args['output_format'] in ('json', 'both'):
+        with report.timed('json_report'), open(DEPENDENCY_DATA_FILE, 'w') as f:
+            json.dump(repository_dependency_info, f, sort_keys = True, indent=2, ensure_ascii = False, default=to_json)
+    if args['output_format'] in ('binary', 'both'):
+        with report.timed('binary_report'):
+            write_dependency_store(repository_dependency_info, DEPENDENCY_STORE_FILE)
+    if 'build' in args:
+        print '... Building repositories in dependency order.'
+        print ''
+        sys.stdout.flush()
+        with report.timed('build'):
+            results = execute_builds([r for group in groups for r in group], upstream, downstream, shlex.split(args['build_command']),
+                                     jobs=int(args['build_jobs']), keep_going='build_keep_going' in args, log_dir=args['build_log_dir'])
+        critical_path = print_build_summary(results, upstream)
+        with open(os.path.join(args['build_log_dir'], 'build_results.json'), 'w') as f:
+            json.dump({'results': results, 'critical_path': critical_path}, f, sort_keys=True, indent=2)
+        update_build_timings(args['build_timings_file'], results)
+        if any(result['status'] == FAILED for result in results.itervalues()):
+            exit(1)
+    if failed_repositories:
+        print ''
+        print 'The dependency files of these repositories could not be updated: {}'.format(', '.join(sorted(failed_repositories)))
+        print 'Run again with --resume to retry only these.'
+        exit(1)
     exit(0)
 
 if __name__ == '__main__':
-    main()
+    # Lets pull all of the arguments at once to force an error early if not available.
+    args = getArguments()
+    report = RunReport('multi-repository-dependency')
+    try:
+        run_profiled(lambda: main(args, report), args.get('profile'))
+    finally:
+        report.print_summary()
+        if 'run_report' in args:
+            report.write(args['run_report'])
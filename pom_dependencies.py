@@ -0,0 +1,146 @@
+# Reads what a repository produces and depends on from its pom.xml files without running maven.
+# Properties of parents outside of the repository are unknown, references to them are left as they are.
+
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+from dependency_model import artifact, dependency_tree_edge, intern_string
+
+PROPERTY_REFERENCE = re.compile(r'\$\{([^}]+)\}')
+
+
+class PomError(Exception):
+    pass
+
+
+def _strip_namespaces(root):
+    # Poms normally use the maven namespace. Drop it so lookups can use plain tag names.
+    for element in root.iter():
+        if isinstance(element.tag, basestring) and element.tag.startswith('{'):
+            element.tag = element.tag.split('}', 1)[1]
+    return root
+
+
+def _text(element, path, default=''):
+    child = element.find(path)
+    if child is None or child.text is None:
+        return default
+    return child.text.strip()
+
+
+class Pom(object):
+
+    def __init__(self, path, parent_pom=None):
+        self.path = path
+        try:
+            self.root = _strip_namespaces(ElementTree.parse(path).getroot())
+        except (ElementTree.ParseError, IOError) as e:
+            raise PomError('Unable to read {}: {}'.format(path, e))
+        parent = self.root.find('parent')
+        self.parent_group_id = _text(parent, 'groupId') if parent is not None else ''
+        self.parent_artifact_id = _text(parent, 'artifactId') if parent is not None else ''
+        self.parent_version = _text(parent, 'version') if parent is not None else ''
+        self.artifact_id = _text(self.root, 'artifactId')
+        self.group_id = _text(self.root, 'groupId') or self.parent_group_id
+        self.version = _text(self.root, 'version') or self.parent_version
+        self.packaging = _text(self.root, 'packaging', 'jar')
+
+        self.properties = {}
+        # Only a parent in the same repository contributes properties and managed versions.
+        if parent_pom is not None and parent_pom.artifact_id == self.parent_artifact_id:
+            self.properties.update(parent_pom.properties)
+            self.managed_versions = dict(parent_pom.managed_versions)
+        else:
+            self.managed_versions = {}
+        properties = self.root.find('properties')
+        if properties is not None:
+            for prop in properties:
+                if isinstance(prop.tag, basestring):
+                    self.properties[prop.tag] = (prop.text or '').strip()
+        self.properties.update({'project.groupId': self.group_id, 'pom.groupId': self.group_id,
+                                'project.artifactId': self.artifact_id, 'pom.artifactId': self.artifact_id,
+                                'project.version': self.version, 'pom.version': self.version,
+                                'project.parent.groupId': self.parent_group_id,
+                                'project.parent.version': self.parent_version})
+        self.group_id = self.interpolate(self.group_id)
+        self.version = self.interpolate(self.version)
+        for dependency in self.root.findall('dependencyManagement/dependencies/dependency'):
+            key = self.interpolate(_text(dependency, 'groupId')) + ':' + self.interpolate(_text(dependency, 'artifactId'))
+            self.managed_versions[key] = self.interpolate(_text(dependency, 'version'))
+
+    def interpolate(self, value, depth=0):
+        if '${' not in value or depth > 10:
+            return value
+        replaced = PROPERTY_REFERENCE.sub(lambda match: self.properties.get(match.group(1), match.group(0)), value)
+        if replaced == value:
+            return value
+        return self.interpolate(replaced, depth + 1)
+
+    def artifact(self):
+        return '{}:{}:{}:{}'.format(self.group_id, self.artifact_id, self.packaging, self.version)
+
+    def modules(self):
+        return [module.text.strip() for module in self.root.findall('modules/module') if module.text and module.text.strip()]
+
+    def dependencies(self):
+        # Yields (group_id, artifact_id, type, version, scope) of the declared dependencies.
+        # The parent and build plugins are left out, as they are in the mvn dependency:tree output.
+        for dependency in self.root.findall('dependencies/dependency'):
+            group_id = self.interpolate(_text(dependency, 'groupId'))
+            artifact_id = self.interpolate(_text(dependency, 'artifactId'))
+            version = self.interpolate(_text(dependency, 'version')) or self.managed_versions.get(group_id + ':' + artifact_id, '')
+            yield group_id, artifact_id, _text(dependency, 'type', 'jar'), version, _text(dependency, 'scope', 'compile')
+
+
+def read_repository_poms(repository):
+    # Returns every pom of the repository, the root first, following <modules> recursively.
+    poms = []
+    pending = [(os.path.join(repository, 'pom.xml'), None)]
+    seen = set()
+    while pending:
+        path, parent_pom = pending.pop(0)
+        path = os.path.normpath(path)
+        if path in seen or not os.path.isfile(path):
+            continue
+        seen.add(path)
+        pom = Pom(path, parent_pom)
+        poms.append(pom)
+        directory = os.path.dirname(path)
+        for module in pom.modules():
+            module_path = os.path.join(directory, module)
+            if os.path.isdir(module_path):
+                module_path = os.path.join(module_path, 'pom.xml')
+            pending.append((module_path, pom))
+    return poms
+
+
+def read_repository_pom_info(repository, comparison_group_id, tree_edges=False):
+    artifacts = []
+    group_dependencies = {}
+    other_dependencies = {}
+    group_dependencies_non_versioned = {}
+    dependency_tree_edges = []
+    poms = read_repository_poms(repository)
+    for pom in poms:
+        pom_artifact = intern_string(pom.artifact())
+        if pom.group_id.startswith(comparison_group_id):
+            artifacts.append(pom_artifact)
+        for group_id, name, type, version, phase in pom.dependencies():
+            new_artifact_entry = artifact(group_id, name, type, version, phase)
+            key = new_artifact_entry.key
+            if group_id.startswith(comparison_group_id):
+                group_dependencies[key] = new_artifact_entry
+                group_dependencies_non_versioned[intern_string(group_id + ':' + name)] = new_artifact_entry
+            else:
+                other_dependencies[key] = new_artifact_entry
+            if tree_edges:
+                dependency_tree_edges.append(dependency_tree_edge(1, pom_artifact, key))
+    # Modules of the same repository depending on each other are not build order edges.
+    repository_artifact_names = set(pom.artifact_id for pom in poms)
+    group_dependencies = dict((k, v) for k, v in group_dependencies.iteritems() if v['name'] not in repository_artifact_names)
+    group_dependencies_non_versioned = dict((k, v) for k, v in group_dependencies_non_versioned.iteritems() if v['name'] not in repository_artifact_names)
+    dependency_info = {'artifacts': artifacts, 'group_dependencies': group_dependencies, 'group_dependencies_non_versioned': group_dependencies_non_versioned, 'other_dependencies': other_dependencies}
+    if tree_edges:
+        dependency_info['dependency_tree_edges'] = dependency_tree_edges
+    return dependency_info
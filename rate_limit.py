@@ -0,0 +1,143 @@
+# Paces GitHub API requests per host and keeps within the X-RateLimit quota.
+
+import time
+import urlparse
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Longest wait for a rate limit reset before giving up on a request.
+MAX_RESET_WAIT_SECONDS = 3600
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimitError(requests.RequestException):
+    pass
+
+
+class HostRateLimiter(object):
+
+    def __init__(self, host, requests_per_second=10.0, burst=20):
+        self.host = host
+        self.rate = float(requests_per_second)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.remaining = None
+        self.limit = None
+        self.reset = None
+        self.calls = 0
+        self.waited_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _current_rate(self, now):
+        # Never faster than the configured rate, slower when the remaining quota would not last until the reset.
+        if self.remaining is None or self.reset is None or self.reset <= now:
+            return self.rate
+        return max(min(self.rate, self.remaining / (self.reset - now)), 1.0 / MAX_RESET_WAIT_SECONDS)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                if self.remaining == 0 and self.reset is not None and self.reset > now:
+                    delay = self.reset - now
+                else:
+                    rate = self._current_rate(now)
+                    self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * rate)
+                    self.last_refill = now
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        self.calls += 1
+                        # Count the request against the quota before its response says so, other threads are sending too.
+                        if self.remaining:
+                            self.remaining -= 1
+                        return
+                    delay = (1.0 - self.tokens) / rate
+                if delay > MAX_RESET_WAIT_SECONDS:
+                    raise RateLimitError('{} is rate limited for another {:.0f} seconds'.format(self.host, delay))
+                self.waited_seconds += delay
+            time.sleep(delay)
+
+    def update(self, response):
+        headers = response.headers
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        with self.lock:
+            # Responses can come back out of order, the lowest remaining count for a reset window is the current one.
+            if self.reset != reset or self.remaining is None or remaining < self.remaining:
+                self.remaining = remaining
+                self.reset = reset
+            try:
+                self.limit = int(headers.get('X-RateLimit-Limit'))
+            except (TypeError, ValueError):
+                pass
+
+    def is_exhausted(self, response):
+        return response.status_code in (403, 429) and response.headers.get('X-RateLimit-Remaining') == '0'
+
+    def usage(self):
+        with self.lock:
+            return {'host': self.host, 'calls': self.calls, 'remaining': self.remaining, 'limit': self.limit, 'waited_seconds': self.waited_seconds}
+
+
+class RateLimitedAdapter(HTTPAdapter):
+
+    def __init__(self, limiter, report=None, pool_maxsize=10):
+        self.limiter = limiter
+        self.report = report
+        super(RateLimitedAdapter, self).__init__(pool_connections=1, pool_maxsize=pool_maxsize)
+
+    def send(self, request, **kwargs):
+        response = self._send(request, **kwargs)
+        if self.limiter.is_exhausted(response):
+            # acquire waits for the reset now that the limiter knows nothing is left.
+            response = self._send(request, **kwargs)
+        return response
+
+    def _send(self, request, **kwargs):
+        self.limiter.acquire()
+        if self.report is not None:
+            with self.report.timed('api_call', self.limiter.host) as event:
+                response = super(RateLimitedAdapter, self).send(request, **kwargs)
+                event['status'] = str(response.status_code)
+        else:
+            response = super(RateLimitedAdapter, self).send(request, **kwargs)
+        self.limiter.update(response)
+        return response
+
+
+def get_rate_limiter(url, requests_per_second=10.0, burst=20):
+    # The limiter of the host of url, created on first use. Later calls share it whatever rate they ask for.
+    host = urlparse.urlparse(url).netloc.lower()
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostRateLimiter(host, requests_per_second, burst)
+        return _limiters[host]
+
+
+def install_rate_limiter(session, url, requests_per_second=10.0, burst=20, report=None, pool_maxsize=10):
+    # Route every request of the session to the host of url through the shared limiter of that host.
+    parsed = urlparse.urlparse(url)
+    limiter = get_rate_limiter(url, requests_per_second, burst)
+    session.mount('{}://{}'.format(parsed.scheme, parsed.netloc), RateLimitedAdapter(limiter, report, pool_maxsize))
+    return limiter
+
+
+def api_usage():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return sorted((limiter.usage() for limiter in limiters), key=lambda usage: usage['host'])
+
+
+def print_api_usage():
+    for usage in api_usage():
+        quota = ''
+        if usage['remaining'] is not None:
+            quota = ', {} of {} left'.format(usage['remaining'], usage['limit'] if usage['limit'] is not None else '?')
+        print 'API calls to {}: {}{}, {:.1f} seconds spent waiting on the rate limit.'.format(usage['host'], usage['calls'], quota, usage['waited_seconds'])
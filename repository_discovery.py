@@ -0,0 +1,129 @@
+# Lists organization repositories through the GitHub REST API. Pages are requested with the ETag of the last run.
+
+import os
+import json
+import urllib
+import urlparse
+import threading
+import requests
+
+from file_utils import atomic_write
+
+PAGE_SIZE = 100
+
+
+class ListingCache(object):
+    # {page url: {'etag': etag, 'names': [repository names], 'next': next page url}}
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pages = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.pages = json.load(f)
+            except ValueError:
+                # A damaged cache only costs a full listing.
+                self.pages = {}
+
+    def get(self, url):
+        with self.lock:
+            return self.pages.get(url)
+
+    def put(self, url, etag, names, next_url):
+        with self.lock:
+            self.pages[url] = {'etag': etag, 'names': names, 'next': next_url}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            with atomic_write(self.path) as f:
+                json.dump(self.pages, f)
+
+
+class DiscoveryError(Exception):
+    pass
+
+
+def create_session(token=None, username=None, password=None, verify=True):
+    session = requests.Session()
+    session.headers['Accept'] = 'application/vnd.github.v3+json'
+    if token:
+        session.headers['Authorization'] = 'token {}'.format(token)
+    elif username:
+        session.auth = (username, password)
+    session.verify = verify
+    return session
+
+
+def check_login(session, api_url, organization):
+    # One request for the organization before anything else, so bad credentials stop the run before the first clone.
+    url = '{}/orgs/{}'.format(api_url.rstrip('/'), organization)
+    try:
+        response = session.get(url)
+    except requests.RequestException as e:
+        raise DiscoveryError('Requesting {} failed: {}'.format(url, e))
+    if response.status_code != 200:
+        raise DiscoveryError('Requesting {} returned HTTP {}'.format(url, response.status_code))
+
+
+def iter_org_repository_pages(session, api_url, organization, cache, stats=None):
+    # Yields the repository names of every listing page as soon as the page arrives.
+    # stats, when given, gets the counts 'requests' and 'not_modified'.
+    stats = stats if stats is not None else {}
+    stats.setdefault('requests', 0)
+    stats.setdefault('not_modified', 0)
+    url = '{}/orgs/{}/repos?type=all&per_page={}'.format(api_url.rstrip('/'), organization, PAGE_SIZE)
+    conditional = True
+    while url:
+        cached_page = cache.get(url)
+        headers = {}
+        if conditional and cached_page and cached_page.get('etag'):
+            headers['If-None-Match'] = cached_page['etag']
+        try:
+            response = session.get(url, headers=headers)
+        except requests.RequestException as e:
+            raise DiscoveryError('Listing {} failed: {}'.format(url, e))
+        stats['requests'] += 1
+        if response.status_code == 304 and cached_page:
+            stats['not_modified'] += 1
+            if 'link' in response.headers:
+                # GitHub sends the Link header with a 304 as well, it knows about pages added since the last run.
+                next_url = response.links.get('next', {}).get('url')
+            elif cached_page['next'] is None and len(cached_page['names']) >= PAGE_SIZE:
+                # The last page was full, repositories added since then are on the page after it.
+                next_url = get_next_page_url(url)
+                conditional = False
+            else:
+                next_url = cached_page['next']
+            if next_url != cached_page['next']:
+                cache.put(url, cached_page['etag'], cached_page['names'], next_url)
+            url = next_url
+            yield [str(name) for name in cached_page['names']]
+            continue
+        if response.status_code != 200:
+            raise DiscoveryError('Listing {} returned HTTP {}'.format(url, response.status_code))
+        conditional = True
+        page_names = [str(repo['name']) for repo in response.json()]
+        next_url = response.links.get('next', {}).get('url')
+        cache.put(url, response.headers.get('ETag'), page_names, next_url)
+        url = next_url
+        yield page_names
+
+
+def get_next_page_url(url):
+    # The url of the listing page after url.
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    parameters = urlparse.parse_qsl(query)
+    page = int(dict(parameters).get('page', 1))
+    parameters = [(name, value) for name, value in parameters if name != 'page'] + [('page', str(page + 1))]
+    return urlparse.urlunsplit((scheme, netloc, path, urllib.urlencode(parameters), fragment))
+
+
+def get_github_api_url(url):
+    # github.com serves its API from a separate host, GitHub Enterprise serves it under /api/v3.
+    if url.rstrip('/') in ('https://github.com', 'http://github.com'):
+        return 'https://api.github.com'
+    return url.rstrip('/') + '/api/v3'
@@ -0,0 +1,60 @@
+# Journal of per repository progress, one JSON line per finished repository, read back by --resume.
+
+import os
+import json
+import time
+import threading
+
+FAILED = 'failed'
+
+
+class RunJournal(object):
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if resume and os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line of an interrupted run can be cut short.
+                        continue
+                    self.entries[entry['repository']] = entry
+            self.file = open(path, 'a')
+        else:
+            self.file = open(path, 'w')
+        self.resumed = len(self.entries)
+
+    def record(self, repository, status, sha=None, seconds=None):
+        entry = {'repository': repository, 'status': status, 'sha': sha, 'seconds': seconds, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        with self.lock:
+            self.entries[repository] = entry
+            self.file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.file.flush()
+
+    def succeeded(self, repository, sha):
+        # True when the journal has the repository finished without error at this sha.
+        with self.lock:
+            entry = self.entries.get(repository)
+        return entry is not None and sha is not None and entry['status'] != FAILED and entry['sha'] == sha
+
+    def failures(self):
+        with self.lock:
+            return sorted(repository for repository, entry in self.entries.iteritems() if entry['status'] == FAILED)
+
+    def print_resume_summary(self):
+        # What --resume picked up from the previous run.
+        if not self.resumed:
+            print 'No previous run found in {}, nothing to resume.'.format(self.path)
+            return
+        failures = self.failures()
+        print 'Resuming from {}: {} repositories recorded by the previous run, {} of them failed.'.format(self.path, self.resumed, len(failures))
+        for repository in failures:
+            print '    retrying: {}'.format(repository)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,147 @@
+# Per stage and per repository timings of a run.
+
+import csv
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+from file_utils import atomic_write
+
+# resource is not available on Windows.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Fields of every event, in the column order of the CSV report.
+EVENT_FIELDS = ['stage', 'repository', 'wall_seconds', 'cpu_seconds', 'subprocess', 'status']
+
+
+def _cpu_seconds():
+    if resource is None:
+        # time.clock is the wall clock on Windows, the best there is without resource.
+        return time.clock()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _children_cpu_seconds():
+    if resource is None:
+        return None
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+
+def _max_rss_bytes(who):
+    # None when unavailable. ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+class RunReport(object):
+
+    def __init__(self, program=None):
+        self.program = program
+        self.start_time = time.time()
+        self.start_cpu = _cpu_seconds()
+        self.events = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, stage, repository=None, subprocess=False):
+        # Yields a dictionary so the block can set a 'status' for the event.
+        event = {'stage': stage, 'repository': repository, 'subprocess': subprocess, 'status': 'ok'}
+        start_time = time.time()
+        start_cpu = _cpu_seconds()
+        try:
+            yield event
+        except BaseException:
+            event['status'] = 'error'
+            raise
+        finally:
+            event['wall_seconds'] = time.time() - start_time
+            event['cpu_seconds'] = _cpu_seconds() - start_cpu
+            with self.lock:
+                self.events.append(event)
+
+    def merge(self, events):
+        # Add events recorded by a worker process.
+        with self.lock:
+            self.events.extend(events)
+
+    def summary(self):
+        stages = {}
+        subprocess_wall_seconds = 0.0
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            stage = stages.setdefault(event['stage'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'max_wall_seconds': 0.0, 'slowest_repository': None})
+            stage['count'] += 1
+            stage['wall_seconds'] += event['wall_seconds']
+            stage['cpu_seconds'] += event['cpu_seconds']
+            if event['wall_seconds'] >= stage['max_wall_seconds']:
+                stage['max_wall_seconds'] = event['wall_seconds']
+                stage['slowest_repository'] = event['repository']
+            if event['subprocess']:
+                subprocess_wall_seconds += event['wall_seconds']
+        return {'program': self.program,
+                'started': time.strftime('%Y-%m-%d_%H_%M_%S', time.localtime(self.start_time)),
+                'wall_seconds': time.time() - self.start_time,
+                'python_cpu_seconds': _cpu_seconds() - self.start_cpu,
+                'subprocess_wall_seconds': subprocess_wall_seconds,
+                'subprocess_cpu_seconds': _children_cpu_seconds(),
+                'peak_rss_bytes': _max_rss_bytes('RUSAGE_SELF'),
+                'subprocess_peak_rss_bytes': _max_rss_bytes('RUSAGE_CHILDREN'),
+                'stages': stages}
+
+    def slowest(self, stage, count=10):
+        with self.lock:
+            events = [event for event in self.events if event['stage'] == stage]
+        return sorted(events, key=lambda event: event['wall_seconds'], reverse=True)[:count]
+
+    def write(self, file_name):
+        # A .csv file gets one row per event, anything else gets the JSON summary plus all events.
+        if file_name.endswith('.csv'):
+            with atomic_write(file_name, 'wb') as f:
+                writer = csv.DictWriter(f, EVENT_FIELDS)
+                writer.writeheader()
+                with self.lock:
+                    for event in self.events:
+                        writer.writerow(event)
+        else:
+            report = self.summary()
+            with self.lock:
+                report['events'] = list(self.events)
+            with atomic_write(file_name) as f:
+                json.dump(report, f, sort_keys=True, indent=2)
+
+    def print_summary(self):
+        summary = self.summary()
+        print ''
+        print '{:<36}{:>8}{:>14}{:>14}{:>14}'.format('stage', 'count', 'wall seconds', 'cpu seconds', 'slowest')
+        for stage, totals in sorted(summary['stages'].iteritems(), key=lambda item: item[1]['wall_seconds'], reverse=True):
+            print '{:<36}{:>8}{:>14.3f}{:>14.3f}{:>14.3f}  {}'.format(stage, totals['count'], totals['wall_seconds'], totals['cpu_seconds'], totals['max_wall_seconds'], totals['slowest_repository'] or '')
+        subprocess_cpu = 'unavailable' if summary['subprocess_cpu_seconds'] is None else '{:.3f}s'.format(summary['subprocess_cpu_seconds'])
+        peak_rss = 'unavailable' if summary['peak_rss_bytes'] is None else '{:.1f} MB'.format(summary['peak_rss_bytes'] / (1024.0 * 1024.0))
+        print 'wall {:.3f}s  python cpu {:.3f}s  subprocess wall {:.3f}s  subprocess cpu {}  peak rss {}'.format(
+            summary['wall_seconds'], summary['python_cpu_seconds'], summary['subprocess_wall_seconds'], subprocess_cpu, peak_rss)
+        sys.stdout.flush()
+
+
+def run_profiled(function, profile_file=None):
+    # Run function under cProfile when a dump file is given.
+    if not profile_file:
+        return function()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(profile_file)
+        print 'Profile written to {}'.format(profile_file)
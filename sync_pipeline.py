@@ -0,0 +1,108 @@
+# Listing and cloning of checkout_all_repos.py overlap through bounded queues, one set per source.
+
+import sys
+import Queue
+import threading
+
+from run_report import RunReport
+
+# Marks the end of a work queue for one clone worker.
+END_OF_WORK = None
+
+
+def run_sync_pipeline(sources, sync_repository, find_maven_repositories, cache=None, report=None):
+    # sources is a list of dictionaries with the keys
+    #   name          source name
+    #   pages         iterable of lists of repository names, consumed on the lister thread
+    #   jobs          number of clone workers
+    #   defer_to      optional list of source names whose repositories are not synced from this source
+    # sync_repository(source, repository)  -> (repository, success, output lines)
+    # find_maven_repositories(repositories) -> the maven repositories among the synced ones, called once after the last sync
+    # Returns {'maven_repos', 'failed_repos', 'listed': {source name: repository names}, 'errors': [messages]}
+    listed = dict((source['name'], []) for source in sources)
+    listing_done = dict((source['name'], threading.Event()) for source in sources)
+    errors = []
+    failed_listings = set()
+    report = report or RunReport()
+    total_jobs = sum(max(1, int(source['jobs'])) for source in sources)
+    results = Queue.Queue(maxsize=2 * total_jobs)
+
+    def lister(source, work):
+        jobs = max(1, int(source['jobs']))
+        held = []
+        try:
+            with report.timed('discovery', source['name']):
+                for page_names in source['pages']:
+                    listed[source['name']].extend(page_names)
+                    if source.get('defer_to'):
+                        held.extend(page_names)
+                    else:
+                        for repository in page_names:
+                            work.put(repository)
+        except Exception as e:
+            errors.append('Unable to list repositories of {}: {}'.format(source['name'], e))
+            failed_listings.add(source['name'])
+        finally:
+            listing_done[source['name']].set()
+        try:
+            if held:
+                deferred_to = set()
+                for name in source['defer_to']:
+                    listing_done[name].wait()
+                    deferred_to.update(listed[name])
+                # Without the complete listing of the other source there is no telling which repositories moved.
+                if not failed_listings.intersection(source['defer_to']):
+                    for repository in held:
+                        if repository not in deferred_to:
+                            work.put(repository)
+        finally:
+            for _ in range(jobs):
+                work.put(END_OF_WORK)
+
+    def clone_worker(source, work):
+        try:
+            while True:
+                repository = work.get()
+                if repository is END_OF_WORK:
+                    break
+                try:
+                    results.put((source['name'],) + tuple(sync_repository(source, repository)))
+                except Exception as e:
+                    results.put((source['name'], repository, False, ['Unable to clone/update {}: {}'.format(repository, e)]))
+        finally:
+            results.put(END_OF_WORK)
+
+    threads = []
+    for source in sources:
+        jobs = max(1, int(source['jobs']))
+        work = Queue.Queue(maxsize=2 * jobs)
+        threads.append(threading.Thread(target=lister, args=(source, work)))
+        threads.extend(threading.Thread(target=clone_worker, args=(source, work)) for _ in range(jobs))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    synced_repos = []
+    failed_repos = []
+    running_workers = total_jobs
+    while running_workers:
+        result = results.get()
+        if result is END_OF_WORK:
+            running_workers -= 1
+            continue
+        source_name, repository, success, lines = result
+        for line in lines:
+            print line
+        if success:
+            synced_repos.append(repository)
+        else:
+            failed_repos.append(repository)
+        print '--------------------------------------------------------------------------------'
+        sys.stdout.flush()
+    for thread in threads:
+        thread.join()
+    if cache is not None:
+        cache.save()
+    with report.timed('pom_detection'):
+        maven_repos = find_maven_repositories(synced_repos)
+    return {'maven_repos': sorted(maven_repos), 'failed_repos': sorted(failed_repos), 'listed': listed, 'errors': errors}
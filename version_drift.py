@@ -0,0 +1,105 @@
+# Version drift of internal and third party dependencies across the workspace.
+
+import re
+
+VERSION_TOKEN = re.compile(r'\d+|[A-Za-z]+')
+# Maven orders these qualifiers before the release itself.
+QUALIFIER_RANKS = {'alpha': -5, 'a': -5, 'beta': -4, 'b': -4, 'milestone': -3, 'm': -3,
+                   'rc': -2, 'cr': -2, 'snapshot': -1, 'ga': 0, 'final': 0, 'release': 0}
+RELEASE = (0, 0, '')
+
+
+def version_key(version):
+    # Sort key close to the maven ordering: 1.2 < 1.10, 1.0-SNAPSHOT < 1.0 = 1.0.0 < 1.0.1.
+    key = []
+    for token in VERSION_TOKEN.findall(version):
+        if token.isdigit():
+            key.append((1, int(token)))
+        else:
+            token = token.lower()
+            key.append((0, QUALIFIER_RANKS.get(token, 1), token))
+    key.append(RELEASE)
+    # Zeros in front of a qualifier or the end do not count, 1.0-rc1 is 1-rc-1.
+    normalized = []
+    for token in reversed(key):
+        if token == (1, 0) and normalized and normalized[-1][0] == 0:
+            continue
+        normalized.append(token)
+    normalized.reverse()
+    return tuple(normalized)
+
+
+def is_resolved(version):
+    # Empty versions and unresolved ${...} properties can not be compared.
+    return bool(version) and '${' not in version
+
+
+def build_version_index(repository_dependency_info, kind):
+    # {group_id:name: {version: set of repositories}} for one dependency kind, in one sweep.
+    index = {}
+    for repository, dependency_info in repository_dependency_info.iteritems():
+        for entry in dependency_info[kind].itervalues():
+            if not is_resolved(entry['version']):
+                continue
+            versions = index.setdefault(entry['group_id'] + ':' + entry['name'], {})
+            versions.setdefault(entry['version'], set()).add(repository)
+    return index
+
+
+def create_produced_versions(repository_dependency_info):
+    # {group_id:name: (version, producing repository)} from the artifacts of every repository.
+    produced_versions = {}
+    for repository, dependency_info in sorted(repository_dependency_info.iteritems()):
+        for artifact in dependency_info['artifacts']:
+            artifact_info = artifact.split(':')
+            if len(artifact_info) < 4:
+                continue
+            produced_versions.setdefault(artifact_info[0] + ':' + artifact_info[1], (artifact_info[3], repository))
+    return produced_versions
+
+
+def _analyze(index, produced_versions):
+    artifacts = []
+    for artifact in sorted(index):
+        versions = index[artifact]
+        producer = None
+        if artifact in produced_versions and is_resolved(produced_versions[artifact][0]):
+            current_version, producer = produced_versions[artifact]
+            source = 'produced'
+        else:
+            current_version = max(versions, key=version_key)
+            source = 'newest'
+        current_key = version_key(current_version)
+        stale = {}
+        for version, repositories in versions.iteritems():
+            if version_key(version) != current_key:
+                for repository in repositories:
+                    stale[repository] = version
+        if not stale and len(versions) < 2:
+            continue
+        artifacts.append({'artifact': artifact, 'current_version': current_version, 'source': source, 'producer': producer,
+                          'versions': dict((version, sorted(repositories)) for version, repositories in versions.iteritems()),
+                          'stale': stale})
+    return artifacts
+
+
+def analyze_version_drift(repository_dependency_info):
+    # Returns {'internal': [...], 'third_party': [...], 'stale_repositories': {...}, 'summary': {...}}.
+    # Every artifact entry lists its versions with their consumers and the consumers that are stale.
+    produced_versions = create_produced_versions(repository_dependency_info)
+    internal = _analyze(build_version_index(repository_dependency_info, 'group_dependencies'), produced_versions)
+    # A third party artifact is never produced in the workspace, so only the newest version counts.
+    third_party = _analyze(build_version_index(repository_dependency_info, 'other_dependencies'), {})
+    stale_repositories = {}
+    for kind, artifacts in (('internal', internal), ('third_party', third_party)):
+        for artifact in artifacts:
+            for repository, version in artifact['stale'].iteritems():
+                stale_repositories.setdefault(repository, []).append({'kind': kind, 'artifact': artifact['artifact'],
+                                                                      'version': version, 'current_version': artifact['current_version']})
+    for entries in stale_repositories.itervalues():
+        entries.sort(key=lambda entry: (entry['kind'], entry['artifact']))
+    summary = {'repositories': len(repository_dependency_info),
+               'internal_artifacts_with_drift': len([a for a in internal if a['stale']]),
+               'third_party_artifacts_with_drift': len([a for a in third_party if a['stale']]),
+               'stale_repositories': len(stale_repositories)}
+    return {'internal': internal, 'third_party': third_party, 'stale_repositories': stale_repositories, 'summary': summary}
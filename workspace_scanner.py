@@ -0,0 +1,93 @@
+# One pass scan of the workspace, cached on the modification times of every repository and its .git directory.
+
+import os
+import json
+
+from git_access import GitError, get_config_value, read_config_value, read_head_sha
+from file_utils import atomic_write
+
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+CACHE_FORMAT_VERSION = 1
+
+
+def _list_directories(path):
+    # Names of the sub directories of path, hidden ones left out. Symbolic links are followed like glob did.
+    if scandir is not None:
+        return [entry.name for entry in scandir(path) if not entry.name.startswith('.') and entry.is_dir()]
+    return [name for name in os.listdir(path) if not name.startswith('.') and os.path.isdir(os.path.join(path, name))]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _read_remote_url(directory):
+    remote_url = read_config_value(directory, 'remote.origin.url')
+    if remote_url is None:
+        try:
+            remote_url = get_config_value(directory, 'remote.origin.url')
+        except GitError:
+            remote_url = ''
+    return remote_url
+
+
+def scan_directory(directory, name):
+    names = set(os.listdir(directory))
+    entry = {'name': name, 'has_pom': 'pom.xml' in names, 'sha': None, 'remote_url': None}
+    if '.git' in names:
+        entry['sha'] = read_head_sha(directory)
+        entry['remote_url'] = _read_remote_url(directory)
+    return entry
+
+
+def read_scan_cache(cache_file):
+    if not cache_file or not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except ValueError:
+        return {}
+    if cache.get('version') != CACHE_FORMAT_VERSION:
+        return {}
+    return cache.get('entries', {})
+
+
+def write_scan_cache(cache_file, entries):
+    with atomic_write(cache_file) as f:
+        json.dump({'version': CACHE_FORMAT_VERSION, 'entries': entries}, f, sort_keys=True)
+
+
+def scan_workspace(path='.', cache_file=None):
+    # Returns [{'name', 'has_pom', 'sha', 'remote_url'}] sorted by name. sha and remote_url are None outside of git.
+    # sha is also None when HEAD can not be read from the files, use git_access.get_head_sha for those.
+    cached_entries = read_scan_cache(cache_file)
+    scanned_entries = {}
+    entries = []
+    for name in sorted(_list_directories(path)):
+        directory = os.path.join(path, name)
+        signature = [_mtime(directory), _mtime(os.path.join(directory, '.git'))]
+        cached = cached_entries.get(name)
+        if cached is not None and cached['signature'] == signature:
+            # json hands back unicode, keep the same str values a fresh scan gives.
+            entry = {'name': name, 'has_pom': cached['has_pom'], 'sha': _str(cached['sha']), 'remote_url': _str(cached['remote_url'])}
+        else:
+            entry = scan_directory(directory, name)
+        scanned_entries[name] = dict(entry, signature=signature)
+        entries.append(entry)
+    if cache_file and scanned_entries != cached_entries:
+        write_scan_cache(cache_file, scanned_entries)
+    return entries